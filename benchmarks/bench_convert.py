@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Protobuf to dict conversion, message_to_dict against MessageToDict.
+
+Converts a list of instances the way a List response of that size is
+converted, plus a disk, an operation and a subnet, checks that both give the
+same dicts and reports seconds of each for every size as JSON.
+
+    python benchmarks/bench_convert.py --sizes 1,100,10000 --repeat 5 \\
+        --output convert.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+from time import perf_counter
+
+import ansible.module_utils
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ansible.module_utils.__path__.append(os.path.join(ROOT, "module_utils"))
+
+# pylint: disable=wrong-import-position
+from ansible.module_utils.yc import message_to_dict  # pylint: disable=E0611, E0401
+from google.protobuf.any_pb2 import Any
+from google.protobuf.json_format import MessageToDict
+from google.protobuf.timestamp_pb2 import Timestamp
+from yandex.cloud.compute.v1.disk_pb2 import Disk
+from yandex.cloud.compute.v1.instance_pb2 import (
+    AttachedDisk,
+    Instance,
+    NetworkInterface,
+    OneToOneNat,
+    PrimaryAddress,
+    Resources,
+    SchedulingPolicy,
+)
+from yandex.cloud.compute.v1.instance_service_pb2 import CreateInstanceMetadata
+from yandex.cloud.operation.operation_pb2 import Operation
+from yandex.cloud.vpc.v1.subnet_pb2 import Subnet
+
+USER_DATA = (
+    "#cloud-config\nusers:\n"
+    + "  - name: user\n    ssh_authorized_keys: [ssh-ed25519 AAAA]\n" * 40
+)
+
+
+def instance(index):
+    return Instance(
+        id="fhm%017d" % index,
+        folder_id="b1gbenchfleet000000",
+        created_at=Timestamp(seconds=1700000000 + index, nanos=123000000),
+        name="fleet-%s" % index,
+        labels=dict(role="worker", index=str(index)),
+        zone_id="ru-central1-a",
+        platform_id="standard-v2",
+        resources=Resources(memory=2 * 2 ** 30, cores=2, core_fraction=100),
+        status=Instance.RUNNING,
+        metadata={"user-data": USER_DATA, "ssh-keys": "user:ssh-ed25519 AAAA"},
+        boot_disk=AttachedDisk(
+            mode=AttachedDisk.READ_WRITE,
+            device_name="boot",
+            auto_delete=True,
+            disk_id="fhmd%016d" % index,
+        ),
+        secondary_disks=[
+            AttachedDisk(mode=AttachedDisk.READ_WRITE, disk_id="fhms%016d" % index)
+        ],
+        network_interfaces=[
+            NetworkInterface(
+                index="0",
+                mac_address="d0:0d:00:00:%02x:%02x" % (index // 256 % 256, index % 256),
+                subnet_id="e9bbenchsubnet000000",
+                primary_v4_address=PrimaryAddress(
+                    address="10.128.%s.%s" % (index // 256 % 256, index % 256),
+                    one_to_one_nat=OneToOneNat(address="51.250.0.%s" % (index % 256)),
+                ),
+                security_group_ids=["enpbenchgroup000000"],
+            )
+        ],
+        fqdn="fleet-%s.ru-central1.internal" % index,
+        scheduling_policy=SchedulingPolicy(preemptible=bool(index % 2)),
+    )
+
+
+def others():
+    """A disk, an operation with Any metadata and response, and a subnet."""
+    metadata, response = Any(), Any()
+    metadata.Pack(CreateInstanceMetadata(instance_id="fhm00000000000000000"))
+    response.Pack(instance(0))
+    return [
+        Disk(
+            id="fhmd0000000000000000",
+            folder_id="b1gbenchfleet000000",
+            type_id="network-hdd",
+            zone_id="ru-central1-a",
+            size=10 * 2 ** 30,
+            status=Disk.READY,
+            instance_ids=["fhm00000000000000000"],
+        ),
+        Operation(
+            id="fhmo0000000000000000",
+            description="Create instance",
+            created_at=Timestamp(seconds=1700000000),
+            done=True,
+            metadata=metadata,
+            response=response,
+        ),
+        Subnet(
+            id="e9bbenchsubnet000000",
+            folder_id="b1gbenchfleet000000",
+            name="default-ru-central1-a",
+            zone_id="ru-central1-a",
+            v4_cidr_blocks=["10.128.0.0/24"],
+        ),
+    ]
+
+
+def measure(convert, messages, repeat):
+    samples = list()
+    for _ in range(repeat):
+        started = perf_counter()
+        for message in messages:
+            convert(message)
+        samples.append(perf_counter() - started)
+    return round(statistics.median(samples), 5)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,100,10000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    for message in others() + [instance(index) for index in range(3)]:
+        if message_to_dict(message) != MessageToDict(message):
+            raise SystemExit(
+                "message_to_dict differs for %s" % message.DESCRIPTOR.full_name
+            )
+
+    results = list()
+    for size in [int(size) for size in args.sizes.split(",")]:
+        messages = [instance(index) for index in range(size)]
+        generic = measure(MessageToDict, messages, args.repeat)
+        fast = measure(message_to_dict, messages, args.repeat)
+        results.append(
+            dict(
+                instances=size,
+                message_to_dict_s=fast,
+                MessageToDict_s=generic,
+                speedup=round(generic / fast, 2) if fast else None,
+            )
+        )
+        print(json.dumps(results[-1]), file=sys.stderr)
+
+    report = dict(python=sys.version.split()[0], repeat=args.repeat, results=results)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Module benchmarks against the fake cloud.
+
+Runs ycc_vm the way Ansible does, one process per task, against an
+in-process fake of the cloud API and reports wall time of every scenario
+for every fleet size as JSON, so reports of two versions can be diffed.
+
+Scenarios:
+    startup       get_info of a missing vm in an empty folder
+    get_info      get_info of one vm in a folder of fleet size vms
+    get_info_snapshot
+                  the same with a cold folder_snapshot
+    add_vm        state=present for fleet size new vms in one batch
+    is_same       the same call again, every vm is compared with _is_same
+    delete_vm     state=absent for the whole batch
+
+    python benchmarks/bench_modules.py --fleet-sizes 1,10,100 --latency 0.01 \\
+        --output report.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+
+from fake_cloud import FakeCloud
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FLEET_FOLDER = "b1gbenchfleet000000"
+CREATE_FOLDER = "b1gbenchcreate00000"
+SCENARIOS = (
+    "startup",
+    "get_info",
+    "get_info_snapshot",
+    "add_vm",
+    "is_same",
+    "delete_vm",
+)
+
+RUNNER = """
+import runpy, sys
+import ansible.module_utils
+ansible.module_utils.__path__.append(%(module_utils)r)
+sys.argv = [%(module)r, %(args)r]
+runpy.run_path(%(module)r, run_name="__main__")
+"""
+
+
+class Bench:
+    def __init__(self, cloud, options):
+        self.cloud = cloud
+        self.options = options
+        self.workdir = tempfile.mkdtemp(prefix="ycc-bench-")
+        self.image_id = cloud.add_image("standard-images", "ubuntu-2004-lts")
+        self.subnet_id = cloud.add_subnet(FLEET_FOLDER)
+
+    def close(self):
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def run(self, module, **args):
+        """Run a module in its own process, returns seconds and its result."""
+        args = dict(
+            args,
+            _ansible_module_name=module,
+            auth=self.cloud.auth(),
+            cache_dir=tempfile.mkdtemp(dir=self.workdir),
+            poll_interval=0.05,
+            poll_max_interval=1,
+        )
+        if module == "ycc_vm":
+            args.update(
+                active_operations_limit_timeout=0,
+                operation_slots=self.options.operation_slots,
+            )
+        args_path = os.path.join(self.workdir, "args.json")
+        with open(args_path, "w") as stream:
+            json.dump(dict(ANSIBLE_MODULE_ARGS=args), stream)
+        code = RUNNER % dict(
+            module_utils=os.path.join(ROOT, "module_utils"),
+            module=os.path.join(ROOT, "modules", "%s.py" % module),
+            args=args_path,
+        )
+        started = perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=False
+        )
+        elapsed = perf_counter() - started
+        try:
+            result = json.loads(process.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            result = dict(failed=True, msg=process.stderr.strip()[-2000:])
+        return elapsed, result
+
+    def vm_spec(self, size):
+        return dict(
+            folder_id=CREATE_FOLDER,
+            subnet_id=self.subnet_id,
+            image_id=self.image_id,
+            login="bench",
+            public_ssh_key="ssh-ed25519 AAAA bench",
+            max_concurrency=self.options.max_concurrency,
+            instances=[dict(name="bench-%s" % index) for index in range(size)],
+        )
+
+    def scenario(self, name, size):
+        """Module name and args of a scenario for a fleet size."""
+        if name == "startup":
+            return "ycc_vm", dict(
+                folder_id=CREATE_FOLDER, name="missing", operation="get_info"
+            )
+        if name == "get_info":
+            return "ycc_vm", dict(
+                folder_id=FLEET_FOLDER,
+                name="fleet-%s" % (size - 1),
+                operation="get_info",
+            )
+        if name == "get_info_snapshot":
+            return "ycc_vm", dict(
+                folder_id=FLEET_FOLDER,
+                name="fleet-%s" % (size - 1),
+                operation="get_info",
+                folder_snapshot=True,
+            )
+        if name in ("add_vm", "is_same"):
+            return "ycc_vm", dict(self.vm_spec(size), state="present")
+        return "ycc_vm", dict(self.vm_spec(size), state="absent")
+
+    def measure(self, name, size):
+        module, args = self.scenario(name, size)
+        samples, failed = list(), 0
+        for _ in range(self.options.repeat):
+            self.cloud.calls.clear()
+            if name in ("is_same", "delete_vm"):
+                self.run(module, **self.scenario("add_vm", size)[1])
+                self.cloud.calls.clear()
+            elapsed, result = self.run(module, **args)
+            calls = dict(sorted(self.cloud.calls.items()))
+            samples.append(elapsed)
+            failed += bool(result.get("failed"))
+            if name in ("add_vm", "is_same"):
+                self.run(module, **self.scenario("delete_vm", size)[1])
+        return dict(
+            scenario=name,
+            fleet_size=size,
+            repeat=self.options.repeat,
+            median_s=round(statistics.median(samples), 4),
+            min_s=round(min(samples), 4),
+            max_s=round(max(samples), 4),
+            failed=failed,
+            calls=calls,
+        )
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fleet-sizes", default="1,10,100,1000,10000")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per call")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--op-limit", type=int, default=0, help="0 is no limit")
+    parser.add_argument(
+        "--op-time", type=float, default=0.5, help="seconds per operation"
+    )
+    parser.add_argument("--max-concurrency", type=int, default=10)
+    parser.add_argument(
+        "--operation-slots",
+        type=int,
+        default=0,
+        help="ycc_vm operation_slots, 0 is off",
+    )
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    options = parser.parse_args()
+    sizes = [int(size) for size in options.fleet_sizes.split(",")]
+    scenarios = options.scenarios.split(",")
+
+    results = list()
+    with FakeCloud(
+        latency=options.latency,
+        failure_rate=options.failure_rate,
+        op_limit=options.op_limit,
+        op_time=options.op_time,
+    ) as cloud:
+        bench = Bench(cloud, options)
+        try:
+            if "startup" in scenarios:
+                results.append(bench.measure("startup", 0))
+            for size in sizes:
+                cloud.reset()
+                cloud.populate(FLEET_FOLDER, size, bench.subnet_id, bench.image_id)
+                for name in scenarios:
+                    if name != "startup":
+                        results.append(bench.measure(name, size))
+                        print(json.dumps(results[-1]), file=sys.stderr)
+        finally:
+            bench.close()
+
+    report = dict(
+        revision=git_revision(),
+        python=sys.version.split()[0],
+        config=dict(
+            latency=options.latency,
+            failure_rate=options.failure_rate,
+            op_limit=options.op_limit,
+            op_time=options.op_time,
+            max_concurrency=options.max_concurrency,
+            operation_slots=options.operation_slots,
+        ),
+        results=results,
+    )
+    text = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, "w") as stream:
+            stream.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
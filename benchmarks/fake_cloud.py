@@ -0,0 +1,686 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""In-process fake of the Compute/VPC gRPC API used by the modules.
+
+Serves the endpoint, IAM token, instance, disk, image, subnet and operation
+services over TLS on localhost, so modules run unchanged against it with
+auth.endpoint and auth.root_certificates pointing at the fake. Every call
+may be slowed down by latency, fail with UNAVAILABLE at failure_rate, and
+mutating calls fail with the cloud's active operations limit error once
+op_limit operations are in flight. Operations are done op_time seconds
+after they are created.
+"""
+
+import datetime
+import random
+import re
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep, time
+
+import grpc
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from google.protobuf.empty_pb2 import Empty
+from google.protobuf.timestamp_pb2 import Timestamp
+from yandex.cloud.compute.v1 import (
+    disk_pb2,
+    disk_service_pb2,
+    disk_service_pb2_grpc,
+    image_pb2,
+    image_service_pb2_grpc,
+    instance_pb2,
+    instance_service_pb2,
+    instance_service_pb2_grpc,
+)
+from yandex.cloud.endpoint import (
+    api_endpoint_pb2,
+    api_endpoint_service_pb2,
+    api_endpoint_service_pb2_grpc,
+)
+from yandex.cloud.iam.v1 import iam_token_service_pb2, iam_token_service_pb2_grpc
+from yandex.cloud.operation import operation_pb2, operation_service_pb2_grpc
+from yandex.cloud.vpc.v1 import subnet_pb2, subnet_service_pb2_grpc
+
+ENDPOINT_IDS = (
+    "endpoint",
+    "iam",
+    "compute",
+    "vpc",
+    "operation",
+    "resource-manager",
+    "resourcemanager",
+)
+OAUTH_TOKEN = "fake-oauth-token"
+OP_LIMIT_MESSAGE = "The limit on maximum number of active operations has exceeded"
+NAME_FILTER = re.compile(r'^name\s*=\s*"(.*)"$')
+
+
+def new_id(prefix):
+    return prefix + uuid.uuid4().hex[:17]
+
+
+def now():
+    stamp = Timestamp()
+    stamp.GetCurrentTime()
+    return stamp
+
+
+def self_signed_certificate():
+    """PEM key and certificate for localhost."""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    issued = datetime.datetime.utcnow()
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(issued - datetime.timedelta(days=1))
+        .not_valid_after(issued + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), False)
+        .sign(key, hashes.SHA256())
+    )
+    key_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption(),
+    )
+    return key_pem, certificate.public_bytes(serialization.Encoding.PEM)
+
+
+class FakeCloud:
+    """State of the fake cloud plus the gRPC server serving it."""
+
+    def __init__(
+        self, latency=0.0, failure_rate=0.0, op_limit=0, op_time=0.5, workers=64
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.op_limit = op_limit
+        self.op_time = op_time
+        self.workers = workers
+        self.lock = threading.RLock()
+        self.calls = dict()
+        self.instances = dict()
+        self.disks = dict()
+        self.images = dict()
+        self.subnets = dict()
+        self.operations = dict()
+        self.pending = set()
+        self.server = None
+        self.port = None
+        self.certificate = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        key, self.certificate = self_signed_certificate()
+        self.server = grpc.server(ThreadPoolExecutor(max_workers=self.workers))
+        api_endpoint_service_pb2_grpc.add_ApiEndpointServiceServicer_to_server(
+            EndpointService(self), self.server
+        )
+        iam_token_service_pb2_grpc.add_IamTokenServiceServicer_to_server(
+            IamTokenService(self), self.server
+        )
+        instance_service_pb2_grpc.add_InstanceServiceServicer_to_server(
+            InstanceService(self), self.server
+        )
+        disk_service_pb2_grpc.add_DiskServiceServicer_to_server(
+            DiskService(self), self.server
+        )
+        image_service_pb2_grpc.add_ImageServiceServicer_to_server(
+            ImageService(self), self.server
+        )
+        subnet_service_pb2_grpc.add_SubnetServiceServicer_to_server(
+            SubnetService(self), self.server
+        )
+        operation_service_pb2_grpc.add_OperationServiceServicer_to_server(
+            OperationService(self), self.server
+        )
+        credentials = grpc.ssl_server_credentials([(key, self.certificate)])
+        self.port = self.server.add_secure_port("localhost:0", credentials)
+        self.server.start()
+
+    def stop(self):
+        self.server.stop(grace=None)
+
+    @property
+    def endpoint(self):
+        return "localhost:%s" % self.port
+
+    def auth(self):
+        """auth module option for modules talking to the fake."""
+        return dict(
+            token=OAUTH_TOKEN,
+            endpoint=self.endpoint,
+            root_certificates=self.certificate.decode("utf-8"),
+        )
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.instances.clear()
+            self.disks.clear()
+            self.operations.clear()
+            self.pending.clear()
+
+    # fixtures
+
+    def add_image(self, folder_id, family):
+        image = image_pb2.Image(
+            id=new_id("fd8"),
+            folder_id=folder_id,
+            created_at=now(),
+            name=family,
+            family=family,
+            min_disk_size=3 * 2 ** 30,
+            status=image_pb2.Image.READY,
+        )
+        self.images[image.id] = image
+        return image.id
+
+    def add_subnet(self, folder_id, zone_id="ru-central1-a"):
+        subnet = subnet_pb2.Subnet(
+            id=new_id("e9b"),
+            folder_id=folder_id,
+            created_at=now(),
+            name="default-%s" % zone_id,
+            network_id=new_id("enp"),
+            zone_id=zone_id,
+            v4_cidr_blocks=["10.128.0.0/16"],
+        )
+        self.subnets[subnet.id] = subnet
+        return subnet.id
+
+    def populate(self, folder_id, count, subnet_id, image_id, prefix="fleet"):
+        """Add count running instances with 10 GB hdd boot disks."""
+        with self.lock:
+            for index in range(count):
+                request = instance_service_pb2.CreateInstanceRequest(
+                    folder_id=folder_id,
+                    name="%s-%s" % (prefix, index),
+                    zone_id="ru-central1-a",
+                    platform_id="standard-v2",
+                    resources_spec=instance_service_pb2.ResourcesSpec(
+                        memory=2 * 2 ** 30, cores=2, core_fraction=100
+                    ),
+                    boot_disk_spec=instance_service_pb2.AttachedDiskSpec(
+                        auto_delete=True,
+                        disk_spec=instance_service_pb2.AttachedDiskSpec.DiskSpec(
+                            type_id="network-hdd", size=10 * 2 ** 30, image_id=image_id
+                        ),
+                    ),
+                    network_interface_specs=[
+                        instance_service_pb2.NetworkInterfaceSpec(subnet_id=subnet_id)
+                    ],
+                )
+                instance = self.new_instance(request)
+                instance.status = instance_pb2.Instance.RUNNING
+
+    # call accounting and fault injection
+
+    def enter(self, context, method, mutating=False):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            sleep(self.latency * random.uniform(0.5, 1.5))
+        if self.failure_rate and random.random() < self.failure_rate:
+            context.abort(grpc.StatusCode.UNAVAILABLE, "injected failure")
+        if mutating and self.op_limit and self.active_operations() >= self.op_limit:
+            context.abort(grpc.StatusCode.FAILED_PRECONDITION, OP_LIMIT_MESSAGE)
+
+    def active_operations(self):
+        with self.lock:
+            return sum(
+                1 for operation in self.operations if not self._refresh(operation).done
+            )
+
+    # operations
+
+    def operation(self, description, metadata, finish):
+        """New operation, finish() is applied once it is done and returns
+        its response message.
+        """
+        with self.lock:
+            operation = operation_pb2.Operation(
+                id=new_id("fhm"),
+                description=description,
+                created_at=now(),
+                created_by="fake",
+                modified_at=now(),
+                done=False,
+            )
+            operation.metadata.Pack(metadata)
+            self.operations[operation.id] = (
+                operation,
+                monotonic() + self.op_time,
+                finish,
+            )
+            self.pending.add(operation.id)
+            return operation
+
+    def _refresh(self, operation_id):
+        operation, done_at, finish = self.operations[operation_id]
+        if not operation.done and monotonic() >= done_at:
+            operation.response.Pack(finish())
+            operation.done = True
+            operation.modified_at.CopyFrom(now())
+            self.pending.discard(operation_id)
+        return operation
+
+    def settle(self):
+        """Finish every operation that is due, so instances reach their final
+        status without anyone polling the operation, as in the real cloud.
+        """
+        with self.lock:
+            for operation_id in list(self.pending):
+                self._refresh(operation_id)
+
+    def get_operation(self, operation_id):
+        with self.lock:
+            if operation_id not in self.operations:
+                return None
+            result = operation_pb2.Operation()
+            result.CopyFrom(self._refresh(operation_id))
+            return result
+
+    # instances
+
+    def _new_disk(self, folder_id, zone_id, spec):
+        disk = disk_pb2.Disk(
+            id=new_id("fhm"),
+            folder_id=folder_id,
+            created_at=now(),
+            name=spec.name,
+            description=spec.description,
+            type_id=spec.type_id or "network-hdd",
+            zone_id=zone_id,
+            size=spec.size,
+            status=disk_pb2.Disk.READY,
+        )
+        if spec.image_id:
+            disk.source_image_id = spec.image_id
+        elif spec.snapshot_id:
+            disk.source_snapshot_id = spec.snapshot_id
+        self.disks[disk.id] = disk
+        return disk
+
+    def _attach(self, instance, spec, index):
+        if spec.disk_id:
+            disk = self.disks[spec.disk_id]
+        else:
+            disk = self._new_disk(instance.folder_id, instance.zone_id, spec.disk_spec)
+        disk.instance_ids.append(instance.id)
+        return instance_pb2.AttachedDisk(
+            mode=instance_pb2.AttachedDisk.READ_WRITE,
+            device_name="disk-%s" % index,
+            auto_delete=spec.auto_delete,
+            disk_id=disk.id,
+        )
+
+    def new_instance(self, request):
+        instance = instance_pb2.Instance(
+            id=new_id("fhm"),
+            folder_id=request.folder_id,
+            created_at=now(),
+            name=request.name,
+            description=request.description,
+            labels=dict(request.labels),
+            zone_id=request.zone_id,
+            platform_id=request.platform_id,
+            resources=instance_pb2.Resources(
+                memory=request.resources_spec.memory,
+                cores=request.resources_spec.cores,
+                core_fraction=request.resources_spec.core_fraction,
+            ),
+            status=instance_pb2.Instance.PROVISIONING,
+            metadata=dict(request.metadata),
+            fqdn="%s.ru-central1.internal" % (request.hostname or request.name),
+            scheduling_policy=instance_pb2.SchedulingPolicy(
+                preemptible=request.scheduling_policy.preemptible
+            ),
+        )
+        instance.boot_disk.CopyFrom(self._attach(instance, request.boot_disk_spec, 0))
+        for index, spec in enumerate(request.secondary_disk_specs, 1):
+            instance.secondary_disks.append(self._attach(instance, spec, index))
+        for index, spec in enumerate(request.network_interface_specs):
+            address = spec.primary_v4_address_spec.address or "10.128.%s.%s" % (
+                len(self.instances) // 250,
+                len(self.instances) % 250 + 3,
+            )
+            interface = instance_pb2.NetworkInterface(
+                index=str(index),
+                mac_address="d0:0d:%02x:%02x:%02x:%02x"
+                % tuple(random.getrandbits(8) for _ in range(4)),
+                subnet_id=spec.subnet_id,
+                primary_v4_address=instance_pb2.PrimaryAddress(address=address),
+                security_group_ids=spec.security_group_ids,
+            )
+            if spec.primary_v4_address_spec.HasField("one_to_one_nat_spec"):
+                interface.primary_v4_address.one_to_one_nat.address = "51.250.%s.%s" % (
+                    random.randint(0, 255),
+                    random.randint(1, 254),
+                )
+            instance.network_interfaces.append(interface)
+        self.instances[instance.id] = instance
+        return instance
+
+    def find_instance(self, context, instance_id):
+        instance = self.instances.get(instance_id)
+        if instance is None:
+            context.abort(
+                grpc.StatusCode.NOT_FOUND, "Instance %s not found" % instance_id
+            )
+        return instance
+
+
+class EndpointService(api_endpoint_service_pb2_grpc.ApiEndpointServiceServicer):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def List(self, request, context):
+        return api_endpoint_service_pb2.ListApiEndpointsResponse(
+            endpoints=[
+                api_endpoint_pb2.ApiEndpoint(
+                    id=endpoint_id, address=self.cloud.endpoint
+                )
+                for endpoint_id in ENDPOINT_IDS
+            ]
+        )
+
+
+class IamTokenService(iam_token_service_pb2_grpc.IamTokenServiceServicer):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def Create(self, request, context):
+        self.cloud.enter(context, "IamTokenService.Create")
+        if request.WhichOneof("identity") == "yandex_passport_oauth_token":
+            if request.yandex_passport_oauth_token != OAUTH_TOKEN:
+                context.abort(grpc.StatusCode.UNAUTHENTICATED, "Invalid OAuth token")
+        expires_at = Timestamp(seconds=int(time()) + 12 * 60 * 60)
+        return iam_token_service_pb2.CreateIamTokenResponse(
+            iam_token="fake-iam-token", expires_at=expires_at
+        )
+
+
+class InstanceService(instance_service_pb2_grpc.InstanceServiceServicer):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def Get(self, request, context):
+        self.cloud.enter(context, "InstanceService.Get")
+        self.cloud.settle()
+        with self.cloud.lock:
+            return self.cloud.find_instance(context, request.instance_id)
+
+    def List(self, request, context):
+        self.cloud.enter(context, "InstanceService.List")
+        name = None
+        if request.filter:
+            match = NAME_FILTER.match(request.filter)
+            if not match:
+                context.abort(grpc.StatusCode.INVALID_ARGUMENT, "unsupported filter")
+            name = match.group(1)
+        self.cloud.settle()
+        with self.cloud.lock:
+            instances = [
+                instance
+                for instance in self.cloud.instances.values()
+                if instance.folder_id == request.folder_id
+                and (name is None or instance.name == name)
+            ]
+        return paginate(
+            instance_service_pb2.ListInstancesResponse, "instances", instances, request
+        )
+
+    def Create(self, request, context):
+        self.cloud.enter(context, "InstanceService.Create", mutating=True)
+        with self.cloud.lock:
+            for instance in self.cloud.instances.values():
+                if (
+                    instance.folder_id == request.folder_id
+                    and instance.name == request.name
+                ):
+                    context.abort(
+                        grpc.StatusCode.ALREADY_EXISTS, "Instance already exists"
+                    )
+            instance = self.cloud.new_instance(request)
+
+        def finish():
+            instance.status = instance_pb2.Instance.RUNNING
+            return instance
+
+        return self.cloud.operation(
+            "Create instance",
+            instance_service_pb2.CreateInstanceMetadata(instance_id=instance.id),
+            finish,
+        )
+
+    def Delete(self, request, context):
+        self.cloud.enter(context, "InstanceService.Delete", mutating=True)
+        with self.cloud.lock:
+            instance = self.cloud.find_instance(context, request.instance_id)
+            instance.status = instance_pb2.Instance.DELETING
+
+        def finish():
+            self.cloud.instances.pop(instance.id, None)
+            for attached in [instance.boot_disk] + list(instance.secondary_disks):
+                disk = self.cloud.disks.get(attached.disk_id)
+                if disk is None:
+                    continue
+                if attached.auto_delete:
+                    del self.cloud.disks[disk.id]
+                else:
+                    disk.instance_ids.remove(instance.id)
+            return Empty()
+
+        return self.cloud.operation(
+            "Delete instance",
+            instance_service_pb2.DeleteInstanceMetadata(instance_id=instance.id),
+            finish,
+        )
+
+    def _transition(self, context, request, method, transient, final, metadata):
+        self.cloud.enter(context, "InstanceService.%s" % method, mutating=True)
+        with self.cloud.lock:
+            instance = self.cloud.find_instance(context, request.instance_id)
+            instance.status = transient
+
+        def finish():
+            instance.status = final
+            return instance
+
+        return self.cloud.operation(
+            "%s instance" % method, metadata(instance_id=instance.id), finish
+        )
+
+    def Start(self, request, context):
+        return self._transition(
+            context,
+            request,
+            "Start",
+            instance_pb2.Instance.STARTING,
+            instance_pb2.Instance.RUNNING,
+            instance_service_pb2.StartInstanceMetadata,
+        )
+
+    def Stop(self, request, context):
+        return self._transition(
+            context,
+            request,
+            "Stop",
+            instance_pb2.Instance.STOPPING,
+            instance_pb2.Instance.STOPPED,
+            instance_service_pb2.StopInstanceMetadata,
+        )
+
+    def Update(self, request, context):
+        self.cloud.enter(context, "InstanceService.Update", mutating=True)
+        with self.cloud.lock:
+            instance = self.cloud.find_instance(context, request.instance_id)
+
+        def finish():
+            for path in request.update_mask.paths:
+                if path == "labels":
+                    instance.labels.clear()
+                    instance.labels.update(request.labels)
+                elif path == "metadata":
+                    instance.metadata.clear()
+                    instance.metadata.update(request.metadata)
+                elif path in ("name", "description", "platform_id"):
+                    setattr(instance, path, getattr(request, path))
+                elif path.startswith("resources_spec"):
+                    instance.resources.memory = request.resources_spec.memory
+                    instance.resources.cores = request.resources_spec.cores
+                    instance.resources.core_fraction = (
+                        request.resources_spec.core_fraction
+                    )
+            return instance
+
+        return self.cloud.operation(
+            "Update instance",
+            instance_service_pb2.UpdateInstanceMetadata(instance_id=instance.id),
+            finish,
+        )
+
+    def UpdateNetworkInterface(self, request, context):
+        self.cloud.enter(
+            context, "InstanceService.UpdateNetworkInterface", mutating=True
+        )
+        with self.cloud.lock:
+            instance = self.cloud.find_instance(context, request.instance_id)
+
+        def finish():
+            index = int(request.network_interface_index)
+            interface = instance.network_interfaces[index]
+            if "security_group_ids" in request.update_mask.paths:
+                del interface.security_group_ids[:]
+                interface.security_group_ids.extend(request.security_group_ids)
+            return instance
+
+        return self.cloud.operation(
+            "Update network interface",
+            instance_service_pb2.UpdateInstanceNetworkInterfaceMetadata(
+                instance_id=instance.id,
+                network_interface_index=request.network_interface_index,
+            ),
+            finish,
+        )
+
+
+class DiskService(disk_service_pb2_grpc.DiskServiceServicer):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def Get(self, request, context):
+        self.cloud.enter(context, "DiskService.Get")
+        with self.cloud.lock:
+            disk = self.cloud.disks.get(request.disk_id)
+        if disk is None:
+            context.abort(
+                grpc.StatusCode.NOT_FOUND, "Disk %s not found" % request.disk_id
+            )
+        return disk
+
+    def List(self, request, context):
+        self.cloud.enter(context, "DiskService.List")
+        name = None
+        if request.filter:
+            match = NAME_FILTER.match(request.filter)
+            if not match:
+                context.abort(grpc.StatusCode.INVALID_ARGUMENT, "unsupported filter")
+            name = match.group(1)
+        with self.cloud.lock:
+            disks = [
+                disk
+                for disk in self.cloud.disks.values()
+                if disk.folder_id == request.folder_id
+                and (name is None or disk.name == name)
+            ]
+        return paginate(disk_service_pb2.ListDisksResponse, "disks", disks, request)
+
+
+class ImageService(image_service_pb2_grpc.ImageServiceServicer):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def Get(self, request, context):
+        self.cloud.enter(context, "ImageService.Get")
+        image = self.cloud.images.get(request.image_id)
+        if image is None:
+            context.abort(
+                grpc.StatusCode.NOT_FOUND, "Image %s not found" % request.image_id
+            )
+        return image
+
+    def GetLatestByFamily(self, request, context):
+        self.cloud.enter(context, "ImageService.GetLatestByFamily")
+        images = [
+            image
+            for image in self.cloud.images.values()
+            if image.folder_id == request.folder_id and image.family == request.family
+        ]
+        if not images:
+            context.abort(grpc.StatusCode.NOT_FOUND, "Image family not found")
+        return max(images, key=lambda image: image.created_at.ToNanoseconds())
+
+
+class SubnetService(subnet_service_pb2_grpc.SubnetServiceServicer):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def Get(self, request, context):
+        self.cloud.enter(context, "SubnetService.Get")
+        subnet = self.cloud.subnets.get(request.subnet_id)
+        if subnet is None:
+            context.abort(
+                grpc.StatusCode.NOT_FOUND, "Subnet %s not found" % request.subnet_id
+            )
+        return subnet
+
+
+class OperationService(operation_service_pb2_grpc.OperationServiceServicer):
+    def __init__(self, cloud):
+        self.cloud = cloud
+
+    def Get(self, request, context):
+        self.cloud.enter(context, "OperationService.Get")
+        operation = self.cloud.get_operation(request.operation_id)
+        if operation is None:
+            context.abort(
+                grpc.StatusCode.NOT_FOUND,
+                "Operation %s not found" % request.operation_id,
+            )
+        return operation
+
+
+def paginate(response_cls, field, items, request):
+    """Page of items starting at request.page_token, which is an offset."""
+    start = int(request.page_token or 0)
+    size = request.page_size or 1000
+    response = response_cls()
+    getattr(response, field).extend(items[start : start + size])
+    if start + size < len(items):
+        response.next_page_token = str(start + size)
+    return response
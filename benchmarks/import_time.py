@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Import time of ycc_vm per operation.
+
+Every sample is a fresh interpreter importing ycc_vm plus the modules the
+operation loads lazily. "eager" is everything ycc_vm used to import at the
+top, i.e. the cost every task paid before imports became operation scoped.
+
+    python benchmarks/import_time.py --repeat 20 --output import_time.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPERATION_SERVICE = ["yandex.cloud.operation.operation_service_pb2_grpc"]
+DISK_SERVICE = [
+    "yandex.cloud.compute.v1.disk_service_pb2",
+    "yandex.cloud.compute.v1.disk_service_pb2_grpc",
+]
+IMAGE_SERVICE = [
+    "yandex.cloud.compute.v1.image_service_pb2",
+    "yandex.cloud.compute.v1.image_service_pb2_grpc",
+]
+SNAPSHOT_SERVICE = [
+    "yandex.cloud.compute.v1.snapshot_service_pb2",
+    "yandex.cloud.compute.v1.snapshot_service_pb2_grpc",
+]
+SUBNET_SERVICE = [
+    "yandex.cloud.vpc.v1.subnet_service_pb2",
+    "yandex.cloud.vpc.v1.subnet_service_pb2_grpc",
+]
+IAM_TOKEN_SERVICE = ["yandex.cloud.iam.v1.iam_token_service_pb2_grpc"]
+
+OPERATIONS = {
+    "get_info": [],
+    "get_subnet_info": SUBNET_SERVICE,
+    "start": OPERATION_SERVICE,
+    "stop": OPERATION_SERVICE,
+    "update": OPERATION_SERVICE,
+    "absent": OPERATION_SERVICE,
+    "present": OPERATION_SERVICE + DISK_SERVICE + IMAGE_SERVICE + SNAPSHOT_SERVICE,
+    "eager": (
+        OPERATION_SERVICE
+        + DISK_SERVICE
+        + IMAGE_SERVICE
+        + SNAPSHOT_SERVICE
+        + SUBNET_SERVICE
+        + IAM_TOKEN_SERVICE
+        + ["jsonschema"]
+    ),
+}
+
+SAMPLE = """
+import importlib, sys
+from time import perf_counter
+started = perf_counter()
+import ansible.module_utils
+ansible.module_utils.__path__.append(%(module_utils)r)
+sys.path.insert(0, %(modules)r)
+import ycc_vm
+for name in %(extra)r:
+    importlib.import_module(name)
+print(perf_counter() - started)
+"""
+
+
+def sample(extra):
+    code = SAMPLE % dict(
+        module_utils=os.path.join(ROOT, "module_utils"),
+        modules=os.path.join(ROOT, "modules"),
+        extra=extra,
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], check=True, capture_output=True, text=True
+    ).stdout
+    return float(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = dict(python=sys.version.split()[0], repeat=args.repeat, operations=dict())
+    for operation, extra in OPERATIONS.items():
+        samples = [sample(extra) for _ in range(args.repeat)]
+        report["operations"][operation] = dict(
+            median_ms=round(statistics.median(samples) * 1000, 2),
+            min_ms=round(min(samples) * 1000, 2),
+        )
+    eager = report["operations"]["eager"]["median_ms"]
+    for result in report["operations"].values():
+        result["saved_ms"] = round(eager - result["median_ms"], 2)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as stream:
+            stream.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+DOCUMENTATION = """
+---
+name: ycc_compute
+short_description: Yandex compute cloud virtual machines inventory source
+description:
+    - "Builds inventory from virtual machines of Yandex compute cloud folders"
+    - "Uses a YAML configuration file that ends with C(ycc_compute.yml) or C(ycc_compute.yaml)"
+extends_documentation_fragment:
+    - constructed
+    - inventory_cache
+options:
+    plugin:
+        description:
+            - Token that ensures this is a source file for the plugin.
+        required: true
+        choices:
+            - ycc_compute
+    auth:
+        description:
+            - Same auth options as modules use, e.g. token or service_account_key.
+        type: dict
+        required: true
+    folders:
+        description:
+            - Folder ids to list virtual machines from.
+        type: list
+        required: true
+    page_size:
+        description:
+            - Max number of virtual machines fetched by one List call.
+        type: int
+        default: 1000
+    max_concurrency:
+        description:
+            - Max number of folders listed at the same time.
+        type: int
+        default: 8
+    label_group_prefix:
+        description:
+            - Every label adds its vm to group I(label_group_prefix)_key_value.
+        type: str
+        default: label
+    prefer_private_ip:
+        description:
+            - Use private address as ansible_host even when vm has a public one.
+        type: bool
+        default: false
+author:
+    - Rotaru Sergey (rsv@arenadata.io)
+"""
+
+EXAMPLES = """
+# inventory.ycc_compute.yml
+plugin: ycc_compute
+auth:
+    token: "{{ lookup('env', 'YC_TOKEN') }}"
+folders:
+    - b1gotqhf076hh183dn
+    - b1g2jt0c7gq1ncjnqc4e
+cache: true
+cache_timeout: 300
+keyed_groups:
+    - key: yc_zone_id
+      prefix: zone
+"""
+
+# pylint: disable=wrong-import-position
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import ansible.module_utils
+from ansible import constants as C
+from ansible.errors import AnsibleError
+
+
+def _add_module_utils_paths():
+    """Make ansible.module_utils.yc importable on the controller. Ansible
+    adds module_utils directories to the payloads of modules only, so the
+    plugin adds the configured ones and module_utils of this repo itself.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    paths = list(C.DEFAULT_MODULE_UTILS_PATH or ())
+    paths.append(os.path.join(root, "module_utils"))
+    for path in paths:
+        path = os.path.abspath(os.path.expanduser(path))
+        if os.path.isdir(path) and path not in ansible.module_utils.__path__:
+            ansible.module_utils.__path__.append(path)
+
+
+_add_module_utils_paths()
+
+from ansible.module_utils.yc import (  # pylint: disable=E0611, E0401
+    IamTokenError,
+    list_items,
+    message_to_dict,
+    yc_argument_spec,
+    yc_sdk,
+)
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable, Constructable
+from yandex.cloud.compute.v1.instance_service_pb2 import ListInstancesRequest
+from yandex.cloud.compute.v1.instance_service_pb2_grpc import InstanceServiceStub
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = "ycc_compute"
+
+    def verify_file(self, path):
+        return super().verify_file(path) and path.endswith(
+            ("ycc_compute.yml", "ycc_compute.yaml")
+        )
+
+    def parse(self, inventory, loader, path, cache=True):
+        super().parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+        use_cache = self.get_option("cache") and cache
+        update_cache = self.get_option("cache") and not cache
+        instances = None
+        if use_cache:
+            try:
+                instances = self._cache[cache_key]
+            except KeyError:
+                update_cache = True
+        if instances is None:
+            instances = self._list_folders()
+        if update_cache:
+            self._cache[cache_key] = instances
+
+        for instance in instances:
+            self._add_instance(instance)
+
+    def _auth(self):
+        options = yc_argument_spec()["auth"]["options"]
+        auth = {key: option.get("default") for key, option in options.items()}
+        for key, value in (self.get_option("auth") or {}).items():
+            if self.templar.is_template(value):
+                value = self.templar.template(value)
+            auth[key] = value
+        if not (auth["token"] or auth["service_account_key"]):
+            raise AnsibleError(
+                "authorization token or service account key should be provided."
+            )
+        if isinstance(auth["root_certificates"], str):
+            auth["root_certificates"] = auth["root_certificates"].encode("utf-8")
+        return auth
+
+    def _list_folders(self):
+        """List all folders at the same time, every folder page by page."""
+        try:
+            instance_service = yc_sdk(self._auth()).client(InstanceServiceStub)
+        except IamTokenError as err:
+            raise AnsibleError(err.details()) from err
+        folders = self.get_option("folders")
+        with ThreadPoolExecutor(max_workers=self.get_option("max_concurrency")) as pool:
+            pages = pool.map(
+                lambda folder: self._list_folder(instance_service, folder), folders
+            )
+            return [instance for page in pages for instance in page]
+
+    def _list_folder(self, instance_service, folder_id):
+        instances = list_items(
+            instance_service,
+            ListInstancesRequest(folder_id=folder_id),
+            "instances",
+            self.get_option("page_size"),
+        )
+        return [message_to_dict(instance) for instance in instances]
+
+    def _add_instance(self, instance):
+        host = instance["name"]
+        self.inventory.add_host(host)
+
+        private_ips, public_ips = list(), list()
+        for interface in instance.get("networkInterfaces", []):
+            address = interface.get("primaryV4Address", {})
+            if address.get("address"):
+                private_ips.append(address["address"])
+            if address.get("oneToOneNat", {}).get("address"):
+                public_ips.append(address["oneToOneNat"]["address"])
+
+        hostvars = dict(
+            yc_id=instance["id"],
+            yc_name=instance["name"],
+            yc_fqdn=instance.get("fqdn"),
+            yc_folder_id=instance["folderId"],
+            yc_zone_id=instance["zoneId"],
+            yc_platform_id=instance.get("platformId"),
+            yc_status=instance.get("status"),
+            yc_labels=instance.get("labels", {}),
+            yc_private_ips=private_ips,
+            yc_public_ips=public_ips,
+        )
+        if public_ips and not self.get_option("prefer_private_ip"):
+            hostvars["ansible_host"] = public_ips[0]
+        elif private_ips:
+            hostvars["ansible_host"] = private_ips[0]
+        for key, value in hostvars.items():
+            self.inventory.set_variable(host, key, value)
+
+        prefix = self.get_option("label_group_prefix")
+        for key, value in hostvars["yc_labels"].items():
+            group = self.inventory.add_group(
+                self._sanitize_group_name("%s_%s_%s" % (prefix, key, value))
+            )
+            self.inventory.add_child(group, host)
+
+        strict = self.get_option("strict")
+        self._set_composite_vars(
+            self.get_option("compose"), hostvars, host, strict=strict
+        )
+        self._add_host_to_composed_groups(
+            self.get_option("groups"), hostvars, host, strict=strict
+        )
+        self._add_host_to_keyed_groups(
+            self.get_option("keyed_groups"), hostvars, host, strict=strict
+        )
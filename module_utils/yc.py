@@ -10,39 +10,1160 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from time import sleep
+import asyncio
+import base64
+import contextvars
+import fcntl
+import json
+import math
+import os
+import random
+import re
+import tempfile
+import threading
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from time import monotonic, sleep, time, time_ns
 
+import grpc
 from ansible.module_utils.basic import AnsibleModule
-from yandexcloud import SDK, RetryInterceptor
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.internal.type_checkers import ToShortestFloat
+from google.protobuf.json_format import MessageToDict
+from yandexcloud import SDK
+
+IAM_TOKEN_AUDIENCE = "https://iam.api.cloud.yandex.net/iam/v1/tokens"
+JWT_LIFETIME = 360
+SDK_AUTH_KEYS = ("token", "service_account_key", "endpoint", "root_certificates")
+RETRYABLE_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.RESOURCE_EXHAUSTED)
+QUOTA_MESSAGES = ("The limit on maximum number of active operations has exceeded",)
+# params that become attributes of the root span of a module run
+TRACE_PARAMS = ("state", "operation", "name", "folder_id")
+CURRENT_SPAN = contextvars.ContextVar("yc_current_span", default=None)
+INT64_TYPES = (FieldDescriptor.CPPTYPE_INT64, FieldDescriptor.CPPTYPE_UINT64)
+# well-known types MessageToDict renders as a string, the rest of them
+# (Any, Struct, Value, wrappers) are left to MessageToDict
+JSON_STRING_TYPES = (
+    "google.protobuf.Timestamp",
+    "google.protobuf.Duration",
+    "google.protobuf.FieldMask",
+)
+# Any fields of an Operation, projected like the resources they hold
+OPERATION_PAYLOADS = ("metadata", "response")
+# return_fields of compact: true, fields missing from a resource are skipped
+COMPACT_FIELDS = (
+    "id",
+    "name",
+    "folderId",
+    "zoneId",
+    "status",
+    "fqdn",
+    "networkInterfaces.primaryV4Address.address",
+    "networkInterfaces.primaryV4Address.oneToOneNat.address",
+    "bootDisk.diskId",
+    "secondaryDisks.diskId",
+    "typeId",
+    "size",
+    "instanceIds",
+    "done",
+    "error",
+)
 
 
 def yc_argument_spec():
     return dict(
-        auth=dict(type='dict', options=dict(
-            token=dict(type="str", required=False, default=None),
-            service_account_key=dict(type="dict", required=False, default=None),
-            endpoint=dict(type="str", required=False, default='api.cloud.yandex.net'),
-            root_certificates=dict(type="str", required=False, default=None))))
+        auth=dict(
+            type="dict",
+            options=dict(
+                token=dict(type="str", required=False, default=None),
+                service_account_key=dict(type="dict", required=False, default=None),
+                endpoint=dict(
+                    type="str", required=False, default="api.cloud.yandex.net"
+                ),
+                root_certificates=dict(type="str", required=False, default=None),
+                token_cache=dict(type="bool", required=False, default=False),
+                token_cache_dir=dict(
+                    type="path", required=False, default="~/.ansible/yc_cache"
+                ),
+                token_cache_margin=dict(type="int", required=False, default=300),
+                broker=dict(type="bool", required=False, default=False),
+                broker_idle_timeout=dict(type="int", required=False, default=300),
+            ),
+        ),
+        cache_dir=dict(type="path", required=False, default="~/.ansible/yc_cache"),
+        wait_timeout=dict(type="int", required=False, default=None),
+        poll_interval=dict(type="float", required=False, default=0.25),
+        poll_max_interval=dict(type="float", required=False, default=10),
+        poll_multiplier=dict(type="float", required=False, default=2),
+        poll_jitter=dict(type="float", required=False, default=0.1),
+        max_inflight_rpcs=dict(type="int", required=False, default=32),
+        max_retries=dict(type="int", required=False, default=5),
+        retry_multiplayer=dict(type="float", required=False, default=2),
+        retry_base_delay=dict(type="float", required=False, default=0.5),
+        retry_max_delay=dict(type="float", required=False, default=20),
+        retry_budget=dict(type="int", required=False, default=50),
+        profile=dict(type="bool", required=False, default=False),
+        trace_file=dict(type="path", required=False, default=None),
+        trace_id=dict(type="str", required=False, default=None),
+        return_fields=dict(type="list", elements="str", required=False, default=None),
+        compact=dict(type="bool", required=False, default=False),
+    )
 
 
 class YC(AnsibleModule):
+    # keys of results that hold a resource, of dicts of resources and of
+    # dicts of nested results, return_fields apply to the resources
+    RESOURCE_KEYS = ()
+    RESOURCE_MAPS = ()
+    RESULT_MAPS = ()
+
     def __init__(self, *args, **kwargs):
+        self.waits = list()
+        self.timings = Timings()
+        self.retry_policy = None
         argument_spec = yc_argument_spec()
         argument_spec.update(kwargs.get("argument_spec", dict()))
         kwargs["argument_spec"] = argument_spec
         super().__init__(*args, **kwargs)
+        self.tracer = Tracer(
+            self.params["trace_file"], self.params["trace_id"], self._name
+        )
+        self.root_span = self.tracer.start(
+            self._name,
+            **{
+                key: self.params.get(key)
+                for key in TRACE_PARAMS
+                if self.params.get(key)
+            },
+        )
+        CURRENT_SPAN.set(self.root_span)
+        self.retry_policy = RetryPolicy(
+            self.params["max_retries"],
+            self.params["retry_multiplayer"],
+            self.params["retry_base_delay"],
+            self.params["retry_max_delay"],
+            self.params["retry_budget"],
+        )
         if not (self.params["auth"]["token"] or self.params["auth"]["service_account_key"]):
             self.fail_json(msg="authorization token or service account key should be provided.")
-        interceptor = RetryInterceptor(max_retry_count=10)
         if self.params["auth"]["root_certificates"]:
             self.params["auth"]["root_certificates"] = self.params["auth"]["root_certificates"].encode("utf-8")
-        self.sdk = SDK(interceptor=interceptor, **self.params["auth"])
+        if self.params["auth"]["broker"]:
+            from ansible.module_utils.yc_broker import (  # pylint: disable=E0611, E0401, C0415
+                BrokerSDK,
+            )
+
+            self.sdk = BrokerSDK(
+                self.params["auth"],
+                self.params["cache_dir"],
+                self.retry_policy,
+                self._rpc_observer(),
+            )
+        else:
+            try:
+                self.sdk = yc_sdk(
+                    self.params["auth"],
+                    self.retry_policy,
+                    self._rpc_observer(),
+                    self.params["wait_timeout"],
+                )
+            except IamTokenError as err:
+                self.fail_json(msg=err.details())
+        self.aio = AsyncClient(self.sdk, self.params["max_inflight_rpcs"])
+
+    def exit_json(self, **kwargs):
+        self._add_stats(kwargs)
+        super().exit_json(**kwargs)
+
+    def fail_json(self, msg, **kwargs):
+        self._add_stats(kwargs)
+        super().fail_json(msg, **kwargs)
+
+    def _add_stats(self, result):
+        self._project_result(result, self._return_fields())
+        if self.waits:
+            result["waits"] = self.waits
+        params = getattr(self, "params", None) or dict()
+        policy = self.retry_policy
+        if policy and (policy.retries or policy.exhausted or params.get("profile")):
+            result["retries"] = policy.report()
+        if params.get("profile"):
+            result["timings"] = self.timings.report()
+        if getattr(self, "root_span", None):
+            self.root_span.end(result.get("msg") if result.get("failed") else None)
+            self.root_span = None
+            self.tracer.export()
+
+    def _return_fields(self):
+        params = getattr(self, "params", None) or dict()
+        fields = list(params.get("return_fields") or ())
+        if params.get("compact"):
+            fields.extend(COMPACT_FIELDS)
+        return fields
+
+    def _project_result(self, result, fields):
+        if not fields:
+            return
+        for key in self.RESOURCE_KEYS:
+            if isinstance(result.get(key), dict):
+                result[key] = project_resource(result[key], fields)
+        for key in self.RESOURCE_MAPS:
+            if isinstance(result.get(key), dict):
+                result[key] = {
+                    item: project_resource(resource, fields)
+                    for item, resource in result[key].items()
+                }
+        for key in self.RESULT_MAPS:
+            for nested in (result.get(key) or dict()).values():
+                self._project_result(nested, fields)
+
+    def _rpc_observer(self):
+        """Callback for every cloud call when profile or trace_file is set."""
+        if self.params["profile"] or self.params["trace_file"]:
+            return self._observe_rpc
+        return None
+
+    def _observe_rpc(self, method, code, attempts, duration):
+        self.timings.rpc(method, code, attempts, duration)
+        self.tracer.record(
+            method,
+            duration,
+            error=None if code in ("OK", None) else code,
+            **{
+                "rpc.method": method,
+                "rpc.grpc.status_code": code,
+                "rpc.attempts": attempts,
+            },
+        )
+
+    def record_loop(self, loop_name, duration, **attrs):
+        """Record a wait or sleep loop that has just taken duration seconds."""
+        self.timings.loop(loop_name, duration, **attrs)
+        self.tracer.record(loop_name, duration, **attrs)
+
+    def span(self, span_name, **attributes):
+        """Context manager, a span of the trace that is current inside it."""
+        return self.tracer.span(span_name, **attributes)
+
+    def backoff(self):
+        return Backoff(
+            self.params["poll_interval"],
+            self.params["poll_max_interval"],
+            self.params["poll_multiplier"],
+            self.params["poll_jitter"],
+            self.params["wait_timeout"],
+        )
 
     def waiter(self, operation):
-        waiter = self.sdk.waiter(operation.id)
-        for _ in waiter:
-            sleep(1)
-        return waiter.operation
+        """Poll the operation until it is done, sleeping with exponential
+        backoff between polls and failing once wait_timeout is exceeded.
+        """
+        for done in self.wait_each([operation]):
+            return done
+
+    def wait_all(self, operations):
+        """Wait for all operations together, raise OperationError as soon as
+        any of them is done with an error. Returns done operations in the
+        order of operations.
+        """
+        done = dict()
+        for operation in self.wait_each(operations):
+            if operation.HasField("error"):
+                raise OperationError(operation)
+            done[operation.id] = operation
+        return [done[operation.id] for operation in operations]
+
+    def wait_each(self, operations, on_missing=None):
+        """Poll all operations in one loop and yield each of them as soon as
+        it is done, so waiting for many takes as long as the slowest one.
+        With on_missing, operations that are not found are passed to it and
+        no longer waited for instead of failing the wait.
+        """
+        return iterate_sync(
+            self.aio.wait_each(operations, self.backoff(), self._wait_done, on_missing)
+        )
+
+    def _wait_done(self, operation_id, polls, waited):
+        self.waits.append(
+            dict(operation_id=operation_id, polls=polls, waited=round(waited, 3))
+        )
+        self.record_loop(
+            "operation_wait", waited, operation_id=operation_id, polls=polls
+        )
+
+
+def message_to_dict(message):
+    """Same as MessageToDict(message) with default options, but every field
+    is converted by a function picked once per message type instead of
+    going through the generic printer field by field.
+    """
+    return _message_converter(message.DESCRIPTOR)(message)
+
+
+_CONVERTERS = dict()
+
+
+def _message_converter(descriptor):
+    converter = _CONVERTERS.get(descriptor.full_name)
+    if converter is None:
+        if descriptor.full_name in JSON_STRING_TYPES:
+            converter = _json_string
+        elif descriptor.file.package == "google.protobuf" and descriptor.fields:
+            converter = MessageToDict
+        else:
+            converter = _regular_converter(descriptor)
+        _CONVERTERS[descriptor.full_name] = converter
+    return converter
+
+
+def _json_string(message):
+    return message.ToJsonString()
+
+
+def _regular_converter(descriptor):
+    """Converter of messages of descriptor, its field table is built by the
+    first call, so messages that contain themselves are fine.
+    """
+    table = None
+
+    def convert(message):
+        nonlocal table
+        if table is None:
+            table = _field_table(descriptor)
+        result = dict()
+        for field, value in message.ListFields():
+            entry = table.get(field)
+            if entry is None:  # an extension
+                return MessageToDict(message)
+            name, convert_value = entry
+            result[name] = value if convert_value is None else convert_value(value)
+        return result
+
+    return convert
+
+
+def _field_table(descriptor):
+    """Json name and converter of every field by field, None converter
+    means the value is used as is.
+    """
+    table = dict()
+    for field in descriptor.fields:
+        message_type = field.message_type
+        if message_type is not None and message_type.GetOptions().map_entry:
+            convert = _map_converter(
+                message_type.fields_by_name["key"], message_type.fields_by_name["value"]
+            )
+        elif _is_repeated(field):
+            convert = _repeated_converter(_value_converter(field))
+        else:
+            convert = _value_converter(field)
+        table[field] = (field.json_name, convert)
+    return table
+
+
+def _is_repeated(field):
+    # label is deprecated since protobuf 5.29, which added is_repeated
+    if hasattr(field, "is_repeated"):
+        return field.is_repeated
+    return field.label == FieldDescriptor.LABEL_REPEATED
+
+
+def _value_converter(field):
+    cpp_type = field.cpp_type
+    if cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+        return _message_converter(field.message_type)
+    if cpp_type == FieldDescriptor.CPPTYPE_ENUM:
+        if field.enum_type.full_name == "google.protobuf.NullValue":
+            return lambda value: None
+        names = {value.number: value.name for value in field.enum_type.values}
+        return lambda value: names.get(value, value)
+    if field.type == FieldDescriptor.TYPE_BYTES:
+        return lambda value: base64.b64encode(value).decode("utf-8")
+    if cpp_type in INT64_TYPES:
+        return str
+    if cpp_type == FieldDescriptor.CPPTYPE_FLOAT:
+        return lambda value: _special_float(value) or ToShortestFloat(value)
+    if cpp_type == FieldDescriptor.CPPTYPE_DOUBLE:
+        return lambda value: _special_float(value) or value
+    return None
+
+
+def _special_float(value):
+    if math.isinf(value):
+        return "-Infinity" if value < 0.0 else "Infinity"
+    if math.isnan(value):
+        return "NaN"
+    return None
+
+
+def _repeated_converter(convert):
+    if convert is None:
+        return list
+    return lambda values: [convert(value) for value in values]
+
+
+def _map_converter(key_field, value_field):
+    convert = _value_converter(value_field)
+    key = _bool_key if key_field.cpp_type == FieldDescriptor.CPPTYPE_BOOL else str
+    if convert is None:
+        return lambda values: {key(item): value for item, value in values.items()}
+    return lambda values: {key(item): convert(value) for item, value in values.items()}
+
+
+def _bool_key(key):
+    return "true" if key else "false"
+
+
+def project(resource, fields):
+    """Copy of resource with only the fields, dotted paths of MessageToDict
+    keys. A path goes through lists item by item, so
+    networkInterfaces.primaryV4Address.address keeps the address of every
+    interface.
+    """
+    projected = dict()
+    for field in fields:
+        _copy_path(resource, projected, field.split("."))
+    return projected
+
+
+def project_resource(resource, fields):
+    """project() of a resource, an operation keeps the fields of itself and
+    of its metadata and response payloads, e.g. the instance an Update
+    returns, each payload with its @type. So id keeps the ids of all three,
+    response.id the id of the response only.
+    """
+    projected = project(resource, fields)
+    for key in OPERATION_PAYLOADS:
+        payload = resource.get(key)
+        if isinstance(payload, dict) and "@type" in payload:
+            kept = dict(projected.get(key, ()), **{"@type": payload["@type"]})
+            kept.update(project(payload, fields))
+            projected[key] = kept
+    return projected
+
+
+def _copy_path(source, target, keys):
+    key, rest = keys[0], keys[1:]
+    if key not in source:
+        return
+    value = source[key]
+    if not rest:
+        target[key] = value
+    elif isinstance(value, dict):
+        _copy_path(value, target.setdefault(key, dict()), rest)
+    elif isinstance(value, list):
+        copies = target.setdefault(key, [dict() for _ in value])
+        for item, copy in zip(value, copies):
+            if isinstance(item, dict):
+                _copy_path(item, copy, rest)
+
+
+class Timings:
+    """Per-RPC and per-wait-loop timings of one module run."""
+
+    def __init__(self):
+        self.rpcs = list()
+        self.loops = list()
+
+    def rpc(self, method, code, attempts, duration):
+        self.rpcs.append(
+            dict(
+                method=method, code=code, attempts=attempts, duration=round(duration, 4)
+            )
+        )
+
+    def loop(self, loop_name, duration, **attrs):
+        self.loops.append(dict(attrs, loop=loop_name, duration=round(duration, 4)))
+
+    def report(self):
+        totals = dict(
+            rpcs=len(self.rpcs),
+            rpc_seconds=round(sum(rpc["duration"] for rpc in self.rpcs), 4),
+            retries=sum(rpc["attempts"] - 1 for rpc in self.rpcs),
+        )
+        for loop in self.loops:
+            key = "%s_seconds" % loop["loop"]
+            totals[key] = round(totals.get(key, 0) + loop["duration"], 4)
+        return dict(totals=totals, rpcs=self.rpcs, loops=self.loops)
+
+
+class Span:
+    """A timed piece of a module run, see Tracer."""
+
+    def __init__(self, tracer, name, parent, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = "%016x" % random.getrandbits(64)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_ns = time_ns()
+
+    def end(self, error=None, end_ns=None):
+        self.tracer.finished(
+            dict(
+                traceId=self.tracer.trace_id,
+                spanId=self.span_id,
+                parentSpanId=self.parent_id,
+                name=self.name,
+                startTimeUnixNano=self.start_ns,
+                endTimeUnixNano=end_ns or time_ns(),
+                attributes={
+                    key: value
+                    for key, value in self.attributes.items()
+                    if value is not None
+                },
+                status=dict(code="STATUS_CODE_ERROR", message=str(error))
+                if error
+                else dict(code="STATUS_CODE_OK"),
+                resource={"service.name": self.tracer.service},
+            )
+        )
+
+
+class Tracer:
+    """Nested spans of a module run: the run, its handler, cloud calls, waits
+    and sleeps. The current span follows contextvars, so it is inherited by
+    asyncio tasks and by functions run with in_context.
+
+    Spans are appended to path as JSON lines close to the OpenTelemetry span
+    model. Tasks of a play share a trace when given the same trace_id.
+    Without path nothing is kept.
+    """
+
+    def __init__(self, path, trace_id=None, service=None):
+        self.path = path
+        self.trace_id = trace_id or "%032x" % random.getrandbits(128)
+        self.service = service
+        self.spans = list()
+        self.lock = threading.Lock()
+
+    def start(self, span_name, parent=None, **attributes):
+        """Span started now, a child of parent or of the current span."""
+        return Span(self, span_name, parent or CURRENT_SPAN.get(), attributes)
+
+    @contextmanager
+    def activate(self, span):
+        token = CURRENT_SPAN.set(span)
+        try:
+            yield span
+        finally:
+            CURRENT_SPAN.reset(token)
+
+    @contextmanager
+    def span(self, span_name, **attributes):
+        span = self.start(span_name, **attributes)
+        try:
+            with self.activate(span):
+                yield span
+        except BaseException as err:
+            span.end(getattr(err, "details", err.__str__)() or err.__class__.__name__)
+            raise
+        span.end()
+
+    def record(self, span_name, duration, error=None, **attributes):
+        """Span of the current span that has just taken duration seconds."""
+        if self.path:
+            span = self.start(span_name, **attributes)
+            end_ns = time_ns()
+            span.start_ns = end_ns - int(duration * 1e9)
+            span.end(error, end_ns)
+
+    def finished(self, span):
+        if self.path:
+            with self.lock:
+                self.spans.append(span)
+
+    def export(self):
+        """Append finished spans to path, safe for concurrent module processes."""
+        if not self.path or not self.spans:
+            return
+        with self.lock:
+            spans, self.spans = self.spans, list()
+        path = os.path.expanduser(self.path)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        lines = "".join(json.dumps(span, sort_keys=True) + "\n" for span in spans)
+        with file_lock(path + ".lock"):
+            with open(path, "a") as stream:
+                stream.write(lines)
+
+
+def in_context(fn):
+    """fn running in a copy of the current context, e.g. to keep the current
+    span in a worker thread.
+    """
+    return partial(contextvars.copy_context().run, fn)
+
+
+class TimingInterceptor(grpc.UnaryUnaryClientInterceptor):
+    """Wraps the retry interceptor, so it sees every call as a whole: passes
+    its method, final status code, number of attempts and duration to
+    observer.
+    """
+
+    def __init__(self, retry, observer):
+        self.retry = retry
+        self.observer = observer
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        attempts = [0]
+
+        def attempt(details, request):
+            attempts[0] += 1
+            return continuation(details, request)
+
+        started = monotonic()
+        try:
+            outcome = self.retry.intercept_unary_unary(
+                attempt, client_call_details, request
+            )
+        except grpc.RpcError as err:
+            self._record(client_call_details, err.code(), attempts[0], started)
+            raise
+        self._record(client_call_details, outcome.code(), attempts[0], started)
+        return outcome
+
+    def _record(self, client_call_details, code, attempts, started):
+        self.observer(
+            client_call_details.method,
+            code.name if code else None,
+            attempts,
+            monotonic() - started,
+        )
+
+
+class RetryPolicy:
+    """Retries of failed cloud calls shared by every call of a task.
+
+    UNAVAILABLE and RESOURCE_EXHAUSTED are retried up to max_retries times per
+    call, and up to budget times per task, so a broken endpoint fails the task
+    instead of multiplying its calls. The delay before retry n is drawn from
+    [0, min(max_delay, base_delay * multiplier ** n)], full jitter keeps
+    callers that failed together from retrying together.
+    """
+
+    def __init__(
+        self, max_retries=5, multiplier=2, base_delay=0.5, max_delay=20, budget=50
+    ):
+        self.max_retries = max_retries
+        self.multiplier = multiplier
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.retries = 0
+        self.spent = 0
+        self.by_code = dict()
+        self.slept = 0.0
+        self.exhausted = 0
+        self.lock = threading.Lock()
+
+    def delay(self, attempt):
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * self.multiplier ** attempt)
+        )
+
+    def run(self, fn, *args):
+        """fn(*args), retried while it raises a retryable RpcError."""
+        attempt = 0
+        while True:
+            try:
+                return fn(*args)
+            except grpc.RpcError as err:
+                if attempt >= self.max_retries or err.code() not in RETRYABLE_CODES:
+                    raise
+                if not self.take(err.code().name):
+                    raise
+                self.sleep(attempt)
+                attempt += 1
+
+    def take(self, kind):
+        """Count a retry of kind, False once the task budget is spent."""
+        with self.lock:
+            if self.spent >= self.budget:
+                self.exhausted += 1
+                return False
+            self.spent += 1
+            self._count(kind)
+        return True
+
+    def count(self, kind):
+        """Count a retry of kind that is not limited by the budget."""
+        with self.lock:
+            self._count(kind)
+
+    def _count(self, kind):
+        self.retries += 1
+        self.by_code[kind] = self.by_code.get(kind, 0) + 1
+
+    def sleep(self, attempt):
+        delay = self.delay(attempt)
+        sleep(delay)
+        with self.lock:
+            self.slept += delay
+        return delay
+
+    def report(self):
+        with self.lock:
+            return dict(
+                total=self.retries,
+                by_code=dict(self.by_code),
+                slept=round(self.slept, 3),
+                budget_left=max(self.budget - self.spent, 0),
+                budget_exhausted=self.exhausted,
+            )
+
+
+def is_quota_error(err):
+    """Cloud refused a call because a quota of the folder is used up."""
+    return isinstance(err, grpc.RpcError) and any(
+        message in (err.details() or "") for message in QUOTA_MESSAGES
+    )
+
+
+class _CallDetails(
+    namedtuple(
+        "_CallDetails",
+        (
+            "method",
+            "timeout",
+            "metadata",
+            "credentials",
+            "wait_for_ready",
+            "compression",
+        ),
+    ),
+    grpc.ClientCallDetails,
+):
+    pass
+
+
+class RetryPolicyInterceptor(grpc.UnaryUnaryClientInterceptor):
+    """Retries calls with a RetryPolicy. Every call gets an idempotency key
+    first, so a retried Create never makes a second instance.
+    """
+
+    def __init__(self, policy):
+        self.policy = policy
+
+    def intercept_unary_unary(self, continuation, client_call_details, request):
+        metadata = list(client_call_details.metadata or ())
+        if not any(key == "idempotency-key" for key, _ in metadata):
+            metadata.append(("idempotency-key", str(uuid.uuid4())))
+        details = _CallDetails(
+            client_call_details.method,
+            client_call_details.timeout,
+            metadata,
+            client_call_details.credentials,
+            getattr(client_call_details, "wait_for_ready", None),
+            getattr(client_call_details, "compression", None),
+        )
+
+        def attempt():
+            outcome = continuation(details, request)
+            if isinstance(outcome, grpc.RpcError):
+                raise outcome
+            return outcome
+
+        return self.policy.run(attempt)
+
+
+class AsyncClient:
+    """asyncio layer over the SDK clients.
+
+    yandexcloud builds only synchronous channels carrying its auth plugin and
+    retry interceptor, so every RPC goes through the same stubs as synchronous
+    code and runs on a bounded executor, while waits and sleeps are asyncio
+    native. One loop thus keeps up to max_inflight RPCs in flight.
+    """
+
+    def __init__(self, sdk, max_inflight):
+        self.sdk = sdk
+        self.executor = ThreadPoolExecutor(max_workers=max_inflight)
+        self.clients = dict()
+        self.lock = threading.Lock()
+
+    def client(self, stub_ctor):
+        with self.lock:
+            if stub_ctor not in self.clients:
+                self.clients[stub_ctor] = self.sdk.client(stub_ctor)
+            return self.clients[stub_ctor]
+
+    async def call(self, stub_ctor, method, request):
+        """Run stub_ctor.method(request), e.g. List, Get, Create, Update or Delete."""
+        rpc = getattr(self.client(stub_ctor), method)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, in_context(rpc), request
+        )
+
+    async def gather(self, stub_ctor, method, requests, return_exceptions=False):
+        return await asyncio.gather(
+            *(self.call(stub_ctor, method, request) for request in requests),
+            return_exceptions=return_exceptions,
+        )
+
+    async def wait_each(self, operations, backoff, on_done=None, on_missing=None):
+        """Poll all pending operations at the same time every round and yield
+        each of them as soon as it is done. on_done gets operation id, number
+        of polls and seconds waited for every done operation. With on_missing
+        an operation that is not found is dropped and its id passed to it.
+        """
+        delays = backoff.delays()
+        pending = [operation.id for operation in operations]
+        polls = dict.fromkeys(pending, 0)
+        try:
+            while pending:
+                polled = [
+                    asyncio.ensure_future(
+                        self._poll_operation(operation_id, on_missing is not None)
+                    )
+                    for operation_id in pending
+                ]
+                try:
+                    for next_polled in asyncio.as_completed(polled):
+                        operation_id, operation = await next_polled
+                        if operation is None:
+                            pending.remove(operation_id)
+                            on_missing(operation_id)
+                            continue
+                        polls[operation.id] += 1
+                        if operation.done:
+                            pending.remove(operation.id)
+                            if on_done:
+                                on_done(
+                                    operation.id, polls[operation.id], backoff.elapsed()
+                                )
+                            yield operation
+                finally:
+                    for task in polled:
+                        task.cancel()
+                if pending:
+                    await asyncio.sleep(next(delays))
+        except WaitTimeout as err:
+            if on_done:
+                for operation_id in pending:
+                    on_done(operation_id, polls[operation_id], backoff.elapsed())
+            raise WaitTimeout("Operations %s: %s" % (", ".join(pending), err)) from None
+
+    async def _poll_operation(self, operation_id, missing_ok):
+        """Operation id and the operation, None for a missing one if missing_ok."""
+        # pylint: disable=import-outside-toplevel
+        from yandex.cloud.operation.operation_service_pb2 import GetOperationRequest
+        from yandex.cloud.operation.operation_service_pb2_grpc import (
+            OperationServiceStub,
+        )
+
+        try:
+            operation = await self.call(
+                OperationServiceStub,
+                "Get",
+                GetOperationRequest(operation_id=operation_id),
+            )
+        except grpc.RpcError as err:
+            if missing_ok and err.code() is grpc.StatusCode.NOT_FOUND:
+                return operation_id, None
+            raise
+        return operation_id, operation
+
+
+def run_sync(coroutine):
+    """Run a coroutine of AsyncClient from synchronous code."""
+    return asyncio.run(coroutine)
+
+
+def list_items(service, request, field, page_size=1000):
+    """Yield items of List responses one by one, e.g. instances of
+    ListInstancesResponse, fetching the next page only once the previous one
+    is used up. Stop iterating to skip the rest of the pages.
+    """
+    request.page_size = request.page_size or page_size
+    while True:
+        response = service.List(request)
+        yield from getattr(response, field)
+        if not response.next_page_token:
+            return
+        request.page_token = response.next_page_token
+
+
+def iterate_sync(agen):
+    """Iterate an async generator of AsyncClient from synchronous code."""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
+
+
+class WaitTimeout(TimeoutError):
+    def details(self):
+        return str(self)
+
+
+class OperationError(Exception):
+    def __init__(self, operation):
+        super().__init__(operation)
+        self.operation = operation
+
+    def details(self):
+        return "Operation %s (%s) failed: %s" % (
+            self.operation.id,
+            self.operation.description,
+            self.operation.error.message,
+        )
+
+
+class Backoff:
+    """Polling schedule: the first delay is initial, every next one is
+    multiplier times longer up to maximum, each spread by +-jitter share.
+    With timeout set, delays() raises WaitTimeout once it is exceeded.
+    """
+
+    def __init__(self, initial, maximum, multiplier, jitter, timeout=None):
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.timeout = timeout
+        self.started = monotonic()
+
+    def elapsed(self):
+        return monotonic() - self.started
+
+    def delays(self):
+        interval = self.initial
+        while True:
+            delay = interval * (1 + random.uniform(-self.jitter, self.jitter))
+            if self.timeout:
+                remaining = self.timeout - self.elapsed()
+                if remaining <= 0:
+                    raise WaitTimeout(
+                        "Wait timeout = %s seconds exceeded" % self.timeout
+                    )
+                delay = min(delay, remaining)
+            yield delay
+            interval = min(interval * self.multiplier, self.maximum)
+
+
+def yc_sdk(auth, retry_policy=None, observer=None, wait_timeout=0):
+    """SDK for auth params, shared by modules and the inventory plugin.
+    Calls are retried with retry_policy, a default RetryPolicy if it is not
+    given. With observer every call is passed to it, see TimingInterceptor.
+    wait_timeout is the longest wait for an operation of the caller, None
+    if it has no limit.
+    """
+    interceptor = RetryPolicyInterceptor(retry_policy or RetryPolicy())
+    if observer is not None:
+        interceptor = TimingInterceptor(interceptor, observer)
+    return SDK(interceptor=interceptor, **sdk_auth(auth, wait_timeout))
+
+
+def sdk_auth(auth, wait_timeout=0):
+    """SDK keyword arguments for auth params.
+
+    With token_cache a service account key is swapped for a cached IAM token,
+    so warm runs skip the JWT exchange. The SDK cannot refresh such a token,
+    so it has to stay valid for token_cache_margin seconds plus the longest
+    wait. A caller that may wait without limit or longer than a token lives
+    keeps the key, which the SDK exchanges again whenever needed.
+    """
+    kwargs = {key: auth.get(key) for key in SDK_AUTH_KEYS}
+    if auth.get("token_cache") and auth.get("service_account_key"):
+        if wait_timeout is None:
+            return kwargs
+        iam_token = cached_iam_token(auth, auth["token_cache_margin"] + wait_timeout)
+        if iam_token:
+            kwargs["iam_token"] = iam_token
+            kwargs["service_account_key"] = None
+    return kwargs
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive flock on path, shared by every process on the controller."""
+    with open(path, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def read_json(path):
+    try:
+        with open(path) as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json_atomic(path, data):
+    """Write data next to path and rename it over, readers never see a partial file."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "w") as stream:
+            json.dump(data, stream)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def cache_dir(path):
+    path = os.path.expanduser(path)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+
+class FileCache:
+    """JSON values kept in files under path and shared by every module process
+    on the controller. Each key has its own flock, so concurrent readers of a
+    stale key wait for a single fetch instead of running their own.
+    """
+
+    def __init__(self, path, ttl):
+        self.path = cache_dir(path)
+        self.ttl = ttl
+
+    def _file(self, key):
+        return os.path.join(self.path, re.sub(r"[^A-Za-z0-9_.-]", "_", key) + ".json")
+
+    def get(self, key, fetch):
+        """Cached value of key, fetch() result if it is missing or expired."""
+        path = self._file(key)
+        with file_lock(path + ".lock"):
+            cached = read_json(path)
+            if cached and cached.get("stored_at", 0) + self.ttl > time():
+                return cached["value"]
+            value = fetch()
+            write_json_atomic(path, dict(stored_at=time(), value=value))
+        return value
+
+    def invalidate(self, key):
+        path = self._file(key)
+        with file_lock(path + ".lock"):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+class OperationSlots:
+    """Semaphore of size slots shared by every module process on the
+    controller, one flock-ed file per slot under path. A slot is held by an
+    open file, so it is freed when its process exits, whatever the way.
+    """
+
+    def __init__(self, path, name, size):
+        name = re.sub(r"[^A-Za-z0-9_-]", "_", name)
+        self.files = [
+            os.path.join(cache_dir(path), "slot-%s-%s.lock" % (name, index))
+            for index in range(size)
+        ]
+
+    def acquire(self, timeout=None, on_wait=None):
+        """Open file holding a free slot, close it to release the slot. Waits
+        for one up to timeout seconds, without limit when it is 0 and not at
+        all when it is None, like active_operations_limit_timeout. Calls
+        on_wait() between attempts, e.g. to release slots of this process
+        whose operations are done.
+        """
+        started = monotonic()
+        delay = 0.05
+        while True:
+            for path in random.sample(self.files, len(self.files)):
+                slot = open(path, "a")  # pylint: disable=consider-using-with
+                try:
+                    fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return slot
+                except BlockingIOError:
+                    slot.close()
+            if timeout is None:
+                raise WaitTimeout("No free operation slot")
+            if timeout and monotonic() - started > timeout:
+                raise WaitTimeout("No free operation slot in %s seconds" % timeout)
+            if on_wait:
+                on_wait()
+            # waiters are spread over time, so they do not wake up together
+            sleep(random.uniform(0, delay))
+            delay = min(delay * 2, 1)
+
+
+def cached_iam_token(auth, margin):
+    """IAM token for the service account key, from the cache while it is valid
+    for at least margin seconds, otherwise freshly exchanged. None if even a
+    fresh token expires sooner.
+    """
+    key_id = re.sub(r"[^A-Za-z0-9_-]", "_", auth["service_account_key"]["id"])
+    path = os.path.join(cache_dir(auth["token_cache_dir"]), "iam-%s.json" % key_id)
+    with file_lock(path + ".lock"):
+        cached = read_json(path)
+        if cached and cached.get("expires_at", 0) - margin > time():
+            return cached["iam_token"]
+        iam_token, expires_at = create_iam_token(auth)
+        write_json_atomic(path, dict(iam_token=iam_token, expires_at=expires_at))
+    return iam_token if expires_at - margin > time() else None
+
+
+def create_iam_token(auth):
+    """Exchange a service account key for an IAM token, returns the token and
+    its expiration as unix time.
+    """
+    # pylint: disable=import-outside-toplevel
+    import jwt
+    from yandex.cloud.endpoint.api_endpoint_service_pb2 import ListApiEndpointsRequest
+    from yandex.cloud.endpoint.api_endpoint_service_pb2_grpc import (
+        ApiEndpointServiceStub,
+    )
+    from yandex.cloud.iam.v1.iam_token_service_pb2 import CreateIamTokenRequest
+    from yandex.cloud.iam.v1.iam_token_service_pb2_grpc import IamTokenServiceStub
+
+    key = auth["service_account_key"]
+    now = int(time())
+    encoded = jwt.encode(
+        dict(
+            aud=IAM_TOKEN_AUDIENCE,
+            iss=key["service_account_id"],
+            iat=now,
+            exp=now + JWT_LIFETIME,
+        ),
+        key["private_key"],
+        algorithm="PS256",
+        headers=dict(kid=key["id"]),
+    )
+    # the IAM endpoint is discovered like the SDK does it, from the API
+    # endpoints listed by the configured endpoint
+    credentials = grpc.ssl_channel_credentials(auth.get("root_certificates"))
+    interceptor = RetryPolicyInterceptor(RetryPolicy())
+    try:
+        with grpc.secure_channel(auth["endpoint"], credentials) as channel:
+            stub = ApiEndpointServiceStub(grpc.intercept_channel(channel, interceptor))
+            endpoints = stub.List(ListApiEndpointsRequest())
+        iam = {endpoint.id: endpoint.address for endpoint in endpoints.endpoints}.get(
+            "iam"
+        )
+        if not iam:
+            raise IamTokenError("Endpoint %s lists no iam endpoint" % auth["endpoint"])
+        with grpc.secure_channel(iam, credentials) as channel:
+            stub = IamTokenServiceStub(grpc.intercept_channel(channel, interceptor))
+            response = stub.Create(CreateIamTokenRequest(jwt=encoded))
+    except grpc.RpcError as err:
+        raise IamTokenError(
+            "Service account key exchange for an IAM token failed: %s %s"
+            % (err.code().name, err.details())
+        ) from err
+    return response.iam_token, response.expires_at.seconds
+
+
+class IamTokenError(Exception):
+    def details(self):
+        return str(self)
 
 
 def response_error_check(response):
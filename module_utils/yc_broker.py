@@ -0,0 +1,321 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local session broker.
+
+A long-lived process on a Unix socket that keeps an authenticated SDK with
+warm channels, so module runs with auth.broker skip channel and auth setup.
+Modules talk to it through BrokerSDK, which mimics SDK.client(): requests
+and responses travel as serialized protobuf messages, gRPC errors come back
+as _InactiveRpcError with the original code and details.
+"""
+
+import importlib
+import json
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+from functools import partial
+from hashlib import sha1
+from time import monotonic, sleep
+
+from ansible.module_utils.yc import (  # pylint: disable=E0611, E0401
+    RetryPolicy,
+    cache_dir,
+    file_lock,
+    yc_sdk,
+)
+from grpc import RpcError, StatusCode
+from grpc._channel import _InactiveRpcError, _RPCState
+
+FRAME_HEADER = struct.Struct("!II")
+START_TIMEOUT = 30
+BOOTSTRAP = "from ansible.module_utils.yc_broker import serve; serve()"
+
+
+class BrokerError(Exception):
+    def details(self):
+        return str(self)
+
+
+def write_frame(stream, header, payload=b""):
+    header = json.dumps(header).encode("utf-8")
+    stream.write(FRAME_HEADER.pack(len(header), len(payload)) + header + payload)
+    stream.flush()
+
+
+def read_frame(stream):
+    """Header and payload of the next frame, None once the peer is gone."""
+    sizes = stream.read(FRAME_HEADER.size)
+    if len(sizes) < FRAME_HEADER.size:
+        return None
+    header_size, payload_size = FRAME_HEADER.unpack(sizes)
+    header = json.loads(stream.read(header_size).decode("utf-8"))
+    return header, stream.read(payload_size)
+
+
+def dotted_path(obj):
+    return "%s:%s" % (obj.__module__, obj.__qualname__)
+
+
+def method_path(stub_ctor, method, request):
+    """gRPC method path of the call, as the SDK channel reports it, e.g.
+    /yandex.cloud.compute.v1.InstanceService/List.
+    """
+    service = stub_ctor.__name__[: -len("Stub")]
+    return "/%s.%s/%s" % (request.DESCRIPTOR.file.package, service, method)
+
+
+def import_path(path):
+    module, qualname = path.split(":")
+    obj = importlib.import_module(module)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+def socket_path(auth, path):
+    """Socket of the broker for these credentials under cache dir path."""
+    key = sha1(
+        json.dumps(broker_auth(auth), sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    return os.path.join(cache_dir(path), "broker-%s.sock" % key[:16])
+
+
+def broker_auth(auth):
+    """Auth params the broker builds its SDK from. The SDK refreshes IAM
+    tokens of a long-lived broker itself, so the token cache is not used.
+    """
+    auth = {key: value for key, value in auth.items() if not key.startswith("broker")}
+    auth["token_cache"] = False
+    if isinstance(auth.get("root_certificates"), bytes):
+        auth["root_certificates"] = auth["root_certificates"].decode("utf-8")
+    return auth
+
+
+class BrokerSDK:
+    """Stands in for SDK when auth.broker is set: client() returns stubs that
+    proxy every call through the broker, which is started on demand.
+    """
+
+    def __init__(self, auth, path, retry_policy=None, observer=None):
+        self.auth = broker_auth(auth)
+        self.idle_timeout = auth["broker_idle_timeout"]
+        self.path = socket_path(auth, path)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.observer = observer
+        self.local = threading.local()
+
+    def client(self, stub_ctor):
+        return BrokerStub(self, stub_ctor)
+
+    def call(self, stub_ctor, method, request):
+        if self.observer is None:
+            return self.retry_policy.run(self._call, stub_ctor, method, request)
+        attempts = [0]
+
+        def attempt(*args):
+            attempts[0] += 1
+            return self._call(*args)
+
+        started = monotonic()
+        code = "OK"
+        try:
+            return self.retry_policy.run(attempt, stub_ctor, method, request)
+        except _InactiveRpcError as err:
+            code = err.code().name
+            raise
+        except BrokerError:
+            code = None
+            raise
+        finally:
+            self.observer(
+                method_path(stub_ctor, method, request),
+                code,
+                attempts[0],
+                monotonic() - started,
+            )
+
+    def _call(self, stub_ctor, method, request):
+        stream = self._stream()
+        header = dict(
+            stub=dotted_path(stub_ctor),
+            method=method,
+            request=dotted_path(type(request)),
+        )
+        write_frame(stream, header, request.SerializeToString())
+        frame = read_frame(stream)
+        if frame is None:
+            self.local.stream = None
+            raise BrokerError("Connection to broker %s lost" % self.path)
+        reply, payload = frame
+        if "code" in reply:
+            state = _RPCState(
+                (), None, None, StatusCode[reply["code"]], reply["details"]
+            )
+            raise _InactiveRpcError(state)
+        if "error" in reply:
+            raise BrokerError(reply["error"])
+        return import_path(reply["response"]).FromString(payload)
+
+    def _stream(self):
+        """Connection of the current thread, every thread has its own."""
+        if getattr(self.local, "stream", None) is None:
+            self.local.stream = self._connect() or self._start()
+        return self.local.stream
+
+    def _connect(self):
+        """Stream to a running broker, None if there is none. The broker greets
+        every accepted connection, and it never stops while one is open.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+            stream = sock.makefile("rwb")
+            if read_frame(stream) is not None:
+                return stream
+        except OSError:
+            pass
+        sock.close()
+        return None
+
+    def _start(self):
+        with file_lock(self.path + ".lock"):
+            stream = self._connect()
+            if stream is not None:
+                return stream
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+            process = subprocess.Popen(  # pylint: disable=consider-using-with
+                [sys.executable, "-c", BOOTSTRAP],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                env=env,
+                start_new_session=True,
+            )
+            config = dict(
+                auth=self.auth, path=self.path, idle_timeout=self.idle_timeout
+            )
+            process.stdin.write(json.dumps(config).encode("utf-8"))
+            process.stdin.close()
+            deadline = monotonic() + START_TIMEOUT
+            while monotonic() < deadline:
+                if process.poll() is not None:
+                    raise BrokerError("Broker exited with code %s" % process.returncode)
+                stream = self._connect()
+                if stream is not None:
+                    return stream
+                sleep(0.05)
+        raise BrokerError(
+            "Broker %s did not start in %s seconds" % (self.path, START_TIMEOUT)
+        )
+
+
+class BrokerStub:
+    def __init__(self, broker, stub_ctor):
+        self.broker = broker
+        self.stub_ctor = stub_ctor
+
+    def __getattr__(self, method):
+        return partial(self.broker.call, self.stub_ctor, method)
+
+
+class BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            write_frame(self.wfile, dict(broker="ready"))
+            while True:
+                frame = read_frame(self.rfile)
+                if frame is None:
+                    return
+                write_frame(self.wfile, *self.server.dispatch(*frame))
+        finally:
+            self.server.release()
+
+
+class BrokerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, sdk, idle_timeout):
+        self.sdk = sdk
+        self.idle_timeout = idle_timeout
+        self.clients = dict()
+        self.connections = 0
+        self.last_active = monotonic()
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, BrokerHandler)
+
+    def process_request(self, request, client_address):
+        # counted before the handler thread starts, so the idle check can not
+        # stop the broker between accept and the greeting
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def release(self):
+        with self.lock:
+            self.connections -= 1
+            self.last_active = monotonic()
+
+    def client(self, stub_ctor):
+        with self.lock:
+            if stub_ctor not in self.clients:
+                self.clients[stub_ctor] = self.sdk.client(stub_ctor)
+            return self.clients[stub_ctor]
+
+    def dispatch(self, header, payload):
+        try:
+            request = import_path(header["request"]).FromString(payload)
+            rpc = getattr(self.client(import_path(header["stub"])), header["method"])
+            response = rpc(request)
+        except RpcError as err:
+            return dict(code=err.code().name, details=err.details()), b""
+        except Exception as err:  # pylint: disable=broad-except
+            return dict(error="%s: %s" % (err.__class__.__name__, err)), b""
+        return dict(response=dotted_path(type(response))), response.SerializeToString()
+
+    def watch_idle(self):
+        while True:
+            sleep(1)
+            with self.lock:
+                idle = (
+                    not self.connections
+                    and monotonic() - self.last_active > self.idle_timeout
+                )
+            if idle:
+                self.shutdown()
+                return
+
+
+def serve():
+    """Broker process entry point, reads its config from stdin."""
+    config = json.load(sys.stdin)
+    auth = config["auth"]
+    if auth.get("root_certificates"):
+        auth["root_certificates"] = auth["root_certificates"].encode("utf-8")
+    os.umask(0o077)
+    # calls are retried by the modules, with their own policy and budget
+    sdk = yc_sdk(auth, RetryPolicy(max_retries=0))
+    server = BrokerServer(config["path"], sdk, config["idle_timeout"])
+    threading.Thread(target=server.watch_idle, daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(config["path"]):
+            os.unlink(config["path"])
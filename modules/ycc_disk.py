@@ -35,13 +35,76 @@ options:
     id:
         description:
             - Virtual disk id - must be unique throw all folders of cloud.
+            - Mutually exclusive with I(ids).
         type: str
-        required: true
+        required: false
+    ids:
+        description:
+            - Virtual disk ids to get at once, up to I(max_inflight_rpcs) at the same time.
+            - Mutually exclusive with I(id).
+        type: list
+        elements: str
+        required: false
     operation:
         description:
             - get_info
+            - list
         type: str
         required: true
+    folder_id:
+        description:
+            - Folder to list disks of, required with I(operation=list).
+        type: str
+        required: false
+    page_size:
+        description:
+            - Max number of disks fetched by one List call.
+        type: int
+        default: 1000
+        required: false
+    max_results:
+        description:
+            - Stop listing once this many disks matched, 0 is no limit.
+        type: int
+        default: 10000
+        required: false
+    name:
+        description:
+            - List only the disk with this name, filtered by the cloud.
+        type: str
+        required: false
+    zone_id:
+        description:
+            - List only disks of this zone.
+        type: str
+        required: false
+    type_id:
+        description:
+            - List only disks of this type, e.g. network-hdd or network-ssd.
+        type: str
+        required: false
+    labels:
+        description:
+            - List only disks that have all these labels.
+        type: dict
+        required: false
+    attached:
+        description:
+            - List only disks attached to an instance when true, only orphaned disks when false.
+        type: bool
+        required: false
+    return_fields:
+        description:
+            - Dotted paths of disk fields to return instead of the whole disk, e.g. C(instanceIds).
+        type: list
+        elements: str
+        required: false
+    compact:
+        description:
+            - Add id, name, status, zone, type, size and instance ids to I(return_fields).
+        type: bool
+        default: false
+        required: false
 
 """
 
@@ -51,9 +114,28 @@ ycc_disk:
     token: some_token
     operation: get_info
     id: ef3rsa853oiu9tjhguqt
+
+ycc_disk:
+    token: some_token
+    operation: get_info
+    ids:
+        - ef3rsa853oiu9tjhguqt
+        - ef3ki0s5q4bsf8qa2vh6
+
+ycc_disk:
+    token: some_token
+    operation: list
+    folder_id: b1gotqhf076hh183dn
+    attached: false
 """
 
 RETURN = """
+'disks':
+    description: Disks found for I(ids) or by I(operation=list) keyed by id, each like I(disk)
+'missing':
+    description: Ids of I(ids) that have no disk
+'truncated':
+    description: I(operation=list) stopped at I(max_results), more disks may match
 'disk':
     createdAt: ''
     folderId: ''
@@ -70,31 +152,53 @@ RETURN = """
 # pylint: disable=wrong-import-position
 import traceback
 
-from ansible.module_utils.yc import YC  # pylint: disable=E0611, E0401
-from google.protobuf.json_format import MessageToDict
+from ansible.module_utils.yc import (  # pylint: disable=E0611, E0401
+    YC,
+    list_items,
+    message_to_dict,
+    run_sync,
+)
 from grpc import StatusCode
 from grpc._channel import _InactiveRpcError
-from yandex.cloud.compute.v1.disk_service_pb2 import GetDiskRequest
+from yandex.cloud.compute.v1.disk_service_pb2 import GetDiskRequest, ListDisksRequest
 from yandex.cloud.compute.v1.disk_service_pb2_grpc import DiskServiceStub
 
-DISK_OPERATIONS = ["get_info"]
+DISK_OPERATIONS = ["get_info", "list"]
+
+
+# Get answers INVALID_ARGUMENT for ids that are not valid disk ids
+MISSING_CODES = (StatusCode.NOT_FOUND, StatusCode.INVALID_ARGUMENT)
 
 
 def disk_argument_spec():
     return dict(
-        id=dict(type="str", required=True),
+        id=dict(type="str", required=False),
+        ids=dict(type="list", elements="str", required=False),
         operation=dict(choices=DISK_OPERATIONS, required=True),
+        folder_id=dict(type="str", required=False),
+        page_size=dict(type="int", required=False, default=1000),
+        max_results=dict(type="int", required=False, default=10000),
+        name=dict(type="str", required=False),
+        zone_id=dict(type="str", required=False),
+        type_id=dict(type="str", required=False),
+        labels=dict(type="dict", required=False),
+        attached=dict(type="bool", required=False),
     )
 
 
 class YccDisk(YC):
+    RESOURCE_KEYS = ("disk",)
+    RESOURCE_MAPS = ("disks",)
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.disk_service = self.sdk.client(DiskServiceStub)
+        self.disk_service = self.aio.client(DiskServiceStub)
 
     def _get_disk(self, disk_id):
         try:
-            return MessageToDict(self.disk_service.Get(GetDiskRequest(disk_id=disk_id)))
+            return message_to_dict(
+                self.disk_service.Get(GetDiskRequest(disk_id=disk_id))
+            )
         except _InactiveRpcError as err:
             if err._state.code is StatusCode.INVALID_ARGUMENT:  # pylint: disable=W0212
                 return dict()
@@ -106,9 +210,37 @@ class YccDisk(YC):
 
         if operation == "get_info":
             return self.get_info()
+        if operation == "list":
+            return self.list_disks()
+
+    def _get_disks(self, disk_ids):
+        """Get all disks at the same time, returns found disks by id and ids
+        of missing ones.
+        """
+        results = run_sync(
+            self.aio.gather(
+                DiskServiceStub,
+                "Get",
+                [GetDiskRequest(disk_id=disk_id) for disk_id in disk_ids],
+                return_exceptions=True,
+            )
+        )
+        disks, missing = dict(), list()
+        for disk_id, result in zip(disk_ids, results):
+            if isinstance(result, _InactiveRpcError) and result.code() in MISSING_CODES:
+                missing.append(disk_id)
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                disks[disk_id] = message_to_dict(result)
+        return disks, missing
 
     def get_info(self):
         response = dict()
+        if self.params.get("ids") is not None:
+            ids = list(dict.fromkeys(self.params["ids"]))
+            response["disks"], response["missing"] = self._get_disks(ids)
+            return response
         id = self.params.get("id")
         disk = self._get_disk(id)
         if not disk:
@@ -117,10 +249,48 @@ class YccDisk(YC):
         response["disk"] = disk
         return response
 
+    def list_disks(self):
+        """Page through the disks of the folder, keeping only disks that match
+        the local filters, and stop at max_results.
+        """
+        request = ListDisksRequest(folder_id=self.params["folder_id"])
+        if self.params.get("name"):
+            request.filter = 'name="%s"' % self.params["name"]
+        max_results = self.params["max_results"]
+        response = dict(disks=dict(), truncated=False)
+        page_size = self.params["page_size"]
+        for disk in list_items(self.disk_service, request, "disks", page_size):
+            if not self._matches(disk):
+                continue
+            if max_results and len(response["disks"]) >= max_results:
+                response["truncated"] = True
+                break
+            response["disks"][disk.id] = message_to_dict(disk)
+        return response
+
+    def _matches(self, disk):
+        params = self.params
+        if params.get("zone_id") and disk.zone_id != params["zone_id"]:
+            return False
+        if params.get("type_id") and disk.type_id != params["type_id"]:
+            return False
+        attached = params.get("attached")
+        if attached is not None and bool(disk.instance_ids) != attached:
+            return False
+        labels = params.get("labels") or dict()
+        return all(disk.labels.get(key) == str(value) for key, value in labels.items())
+
 
 def main():
     argument_spec = disk_argument_spec()
-    module = YccDisk(argument_spec=argument_spec)
+    module = YccDisk(
+        argument_spec=argument_spec,
+        mutually_exclusive=[("id", "ids")],
+        required_if=[
+            ("operation", "get_info", ("id", "ids"), True),
+            ("operation", "list", ("folder_id",)),
+        ],
+    )
     response = dict()
     # if the user is working with this module in only check mode we do not
     # want to make any changes to the environment, just return the current
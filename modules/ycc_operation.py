@@ -0,0 +1,201 @@
+#!/usr/bin/python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+ANSIBLE_METADATA = {
+    "metadata_version": "1.1",
+    "status": ["preview"],
+    "supported_by": "community",
+}
+
+DOCUMENTATION = """
+---
+module: ycc_operation
+short_description: Ansible module to wait for Yandex cloud operations
+version_added: "2.4"
+description:
+    - "Waits for cloud operations started by other modules with I(wait=false), all of them at the same time"
+
+options:
+    token:
+        description:
+            - Oauth token to access cloud.
+        type: str
+        required: true
+    ids:
+        description:
+            - Operation ids to wait for.
+        type: list
+        elements: str
+        required: true
+    wait_timeout:
+        description:
+            - Seconds to wait for all operations together, no limit when not set.
+            - Operations still running by then are returned in I(pending) and fail the task.
+        type: int
+        required: false
+    fail_on_error:
+        description:
+            - Fail the task when any operation is done with an error or is not found.
+        type: bool
+        default: true
+        required: false
+    return_fields:
+        description:
+            - Dotted paths of operation fields to return instead of the whole operation,
+              e.g. C(response.id).
+            - The paths apply to the C(metadata) and C(response) payloads of the operation
+              too, which keep their C(@type), so C(id) keeps the ids of all three.
+        type: list
+        elements: str
+        required: false
+    compact:
+        description:
+            - Add id, done and error to I(return_fields).
+        type: bool
+        default: false
+        required: false
+
+"""
+
+EXAMPLES = """
+- name: Wait for vms created with wait false
+  ycc_operation:
+    token: {{ my_token }}
+    ids: "{{ created.operation_ids }}"
+    wait_timeout: 600
+"""
+
+RETURN = """
+operations:
+    description: Done operations keyed by id, each with its response or error
+    type: dict
+    returned: always
+errors:
+    description: Ids of operations that are done with an error
+    type: list
+    returned: always
+pending:
+    description: Ids of operations that were not done by I(wait_timeout)
+    type: list
+    returned: always
+missing:
+    description: Ids of operations that were not found, the others are still waited for
+    type: list
+    returned: always
+"""
+
+# pylint: disable=wrong-import-position
+import importlib
+import pkgutil
+import traceback
+
+from ansible.module_utils.yc import (  # pylint: disable=E0611, E0401
+    YC,
+    WaitTimeout,
+    message_to_dict,
+)
+from yandex.cloud.operation.operation_pb2 import Operation
+
+# packages whose protobuf modules _load_types has imported
+LOADED_PACKAGES = set()
+
+
+def operation_argument_spec():
+    return dict(
+        ids=dict(type="list", elements="str", required=True),
+        fail_on_error=dict(type="bool", required=False, default=True),
+    )
+
+
+class YccOperation(YC):
+    RESOURCE_MAPS = ("operations",)
+
+    def wait(self):
+        response = dict(
+            changed=False,
+            operations=dict(),
+            errors=list(),
+            pending=list(),
+            missing=list(),
+        )
+        ids = list(dict.fromkeys(self.params["ids"]))
+        operations = [Operation(id=operation_id) for operation_id in ids]
+        try:
+            for operation in self.wait_each(operations, response["missing"].append):
+                _load_types(operation)
+                response["operations"][operation.id] = message_to_dict(operation)
+                if operation.HasField("error"):
+                    response["errors"].append(operation.id)
+        except WaitTimeout as error:
+            done = set(response["operations"]).union(response["missing"])
+            response["pending"] = [
+                operation_id for operation_id in ids if operation_id not in done
+            ]
+            response["failed"] = True
+            response["msg"] = error.details()
+            return response
+        if self.params["fail_on_error"] and (response["errors"] or response["missing"]):
+            response["failed"] = True
+            messages = list()
+            if response["errors"]:
+                messages.append(
+                    "Operations done with an error: %s" % ", ".join(response["errors"])
+                )
+            if response["missing"]:
+                messages.append(
+                    "Operations not found: %s" % ", ".join(response["missing"])
+                )
+            response["msg"] = "; ".join(messages)
+        return response
+
+
+def _load_types(operation):
+    """Import protobuf modules of the packages of metadata and response of the
+    operation, MessageToDict has to know their types to unpack them.
+    """
+    for field in (operation.metadata, operation.response):
+        package = field.type_url.split("/")[-1].rpartition(".")[0]
+        if not package or package in LOADED_PACKAGES:
+            continue
+        LOADED_PACKAGES.add(package)
+        try:
+            module = importlib.import_module(package)
+        except ImportError:
+            continue
+        for info in pkgutil.iter_modules(module.__path__):
+            if info.name.endswith("_pb2"):
+                importlib.import_module("%s.%s" % (package, info.name))
+
+
+def main():
+    argument_spec = operation_argument_spec()
+    module = YccOperation(argument_spec=argument_spec)
+    response = dict()
+
+    try:
+        response = module.wait()
+    except Exception as error:  # pylint: disable=broad-except
+        if hasattr(error, "details"):
+            response["msg"] = getattr(error, "details")()
+            response["exception"] = traceback.format_exc()
+        else:
+            response["msg"] = "Error during runtime occurred"
+            response["exception"] = traceback.format_exc()
+        module.fail_json(**response)
+
+    module.exit_json(**response)
+
+
+if __name__ == "__main__":
+    main()
@@ -79,6 +79,17 @@ options:
         type: integer
         description: "Active operations limit timeout in seconds"
         display_name: "Active operations limit timeout"
+    operation_slots:
+        description:
+            - Number of operations of the folder that tasks on this controller may run at a time,
+              set it to the folder quota on active operations.
+            - Every task takes a slot before it starts an operation and keeps it until the operation
+              is done, waiting up to I(active_operations_limit_timeout) seconds for a free one,
+              without limit when it is 0 and not at all when it is not set.
+            - Slots are lock files in I(cache_dir) shared by all forks. 0 disables them.
+        type: int
+        default: 0
+        required: false
     platform_id:
         description:
             - Platform id.
@@ -124,6 +135,20 @@ options:
             - standard and target folders
         type: list
         required: false
+    image_cache_ttl:
+        description:
+            - Seconds the image resolved from I(image_family) is reused for by all forks.
+            - 0 resolves the image on every call.
+        type: int
+        default: 0
+        required: false
+    pin_image_for_run:
+        description:
+            - Run id, e.g. set once per play with I(run_once).
+            - All calls with the same run id get the same image from I(image_family),
+            - even if a newer image is published in the middle of the run.
+        type: str
+        required: false
     image_id:
         description:
             - Boot image id.
@@ -195,6 +220,11 @@ options:
             - Vm key value labels
         type: dict
         required: false
+    description:
+        description:
+            - Vm description.
+        type: str
+        required: false
     security_groups:
         description:
             - Vm security group list
@@ -222,17 +252,175 @@ options:
         required: false
     max_retries:
         description:
-            - Max retries to proceed operation/state.
+            - Max retries of a cloud call failed with UNAVAILABLE or RESOURCE_EXHAUSTED.
         type: int
         default: 5
         required: false
     retry_multiplayer:
         description:
-            - Retry multiplayer between retries to proceed operation/state
-            - (wait retry_multiplayer*curent_retry seconds)
+            - Growth of the delay between retries, retry n waits a random time
+              up to min(retry_max_delay, retry_base_delay * retry_multiplayer ** n) seconds.
+            - Retries of the active operations limit use the same delays.
+        type: float
+        default: 2
+        required: false
+    retry_base_delay:
+        description:
+            - Max delay before the first retry, seconds.
+        type: float
+        default: 0.5
+        required: false
+    retry_max_delay:
+        description:
+            - Max delay between retries, seconds.
+        type: float
+        default: 20
+        required: false
+    retry_budget:
+        description:
+            - Max retries of all cloud calls of the task together, the task fails once it is spent.
+        type: int
+        default: 50
+        required: false
+    instances:
+        description:
+            - List of virtual machines to create or delete in one task.
+            - Every item may override any top-level option, unset keys are taken from the top level.
+            - I(name), I(fqdn), I(hostname) and I(assign_internal_ip) are never inherited.
+            - Works with I(state) only.
+        type: list
+        elements: dict
+        required: false
+    max_concurrency:
+        description:
+            - Max number of instances from I(instances) processed at the same time.
         type: int
+        default: 10
+        required: false
+    wait:
+        description:
+            - Wait for the cloud operations the task starts.
+            - With false the task returns I(operation_id) and I(operation_ids) right after they
+              are started, wait for them with the M(ycc_operation) module.
+            - Operation slots of I(operation_slots) are released when such a task ends.
+        type: bool
+        default: true
+        required: false
+    reconcile:
+        description:
+            - With I(state=present), bring an existing instance that differs from the params to them
+              instead of failing.
+            - Labels, metadata, description and security groups are updated in place; cores, memory,
+              core_fraction, platform_id and preemptible with one Update while the instance is stopped.
+            - Other differences, e.g. zone or boot image, need recreation and still fail the instance.
+        type: bool
+        default: false
+        required: false
+    folder_snapshot:
+        description:
+            - Look instances up in a snapshot of the whole folder shared by all forks
+            - instead of listing the folder filtered by name for every host.
+            - The snapshot is dropped by every change this module makes.
+        type: bool
+        default: false
+        required: false
+    folder_snapshot_ttl:
+        description:
+            - Seconds the folder snapshot is reused for.
+        type: int
+        default: 5
+        required: false
+    page_size:
+        description:
+            - Max number of instances fetched by one List call, e.g. for the folder snapshot.
+        type: int
+        default: 1000
+        required: false
+    cache_dir:
+        description:
+            - Directory for caches shared by all forks.
+        type: path
+        default: ~/.ansible/yc_cache
+        required: false
+    wait_timeout:
+        description:
+            - Max seconds to wait for a cloud operation, the task fails once it is exceeded.
+            - No limit by default.
+        type: int
+        required: false
+    status_timeout:
+        description:
+            - Max seconds to wait for an instance found in a transitional status, e.g. STARTING,
+              to become RUNNING or STOPPED. It is polled by id like a cloud operation.
+        type: int
+        default: 60
+        required: false
+    poll_interval:
+        description:
+            - Seconds between the first and the second poll of a cloud operation.
+        type: float
+        default: 0.25
+        required: false
+    poll_max_interval:
+        description:
+            - Max seconds between polls of a cloud operation.
+        type: float
+        default: 10
+        required: false
+    poll_multiplier:
+        description:
+            - Every next interval between polls is that many times longer, up to I(poll_max_interval).
+        type: float
         default: 2
         required: false
+    poll_jitter:
+        description:
+            - Share of the interval between polls randomly added or subtracted.
+        type: float
+        default: 0.1
+        required: false
+    max_inflight_rpcs:
+        description:
+            - Max number of cloud API calls made at the same time, e.g. while polling many operations.
+        type: int
+        default: 32
+        required: false
+    profile:
+        description:
+            - Time every cloud call and wait loop and return it as I(timings).
+        type: bool
+        default: false
+        required: false
+    trace_file:
+        description:
+            - Append spans of the run, its handler, instances, cloud calls, waits and sleeps
+              to this file as JSON lines close to the OpenTelemetry span model.
+        type: path
+        required: false
+    trace_id:
+        description:
+            - Trace id of the spans, pass the same value to every task to see a whole play as one trace.
+            - A random one for every run when not set.
+        type: str
+        required: false
+    return_fields:
+        description:
+            - Dotted paths of instance fields to return instead of the whole instance,
+              e.g. C(networkInterfaces.primaryV4Address.address), lists are walked item by item.
+            - Applies to I(instance) and I(response), also of every item of I(instances).
+            - I(response) of start, stop, update and delete is an operation, the paths apply
+              to it and to its C(metadata) and C(response) payloads, e.g. the updated instance,
+              which keep their C(@type).
+            - Keeps metadata with cloud-init user-data out of the result and hostvars.
+        type: list
+        elements: str
+        required: false
+    compact:
+        description:
+            - Add id, name, status, zone, addresses and disk ids to I(return_fields).
+        type: bool
+        default: false
+        required: false
 
 author:
     - Rotaru Sergey (rsv@arenadata.io)
@@ -275,6 +463,42 @@ EXAMPLES = """
         my_vm: 1
     state: present
 
+- name: Create many vms
+  ycc_vm:
+    token: {{ my_token }}
+    folder_id: b1gotqhf076hh183dn
+    login: john_doe
+    public_ssh_key: john_doe_public_key
+    image_id: fd84uob96bu79jk8fqht
+    subnet_id: b0cccg656k0nixi92a
+    max_concurrency: 20
+    instances:
+        - name: worker-1
+        - name: worker-2
+          cores: 4
+          memory: 8
+    state: present
+
+- name: Start creating vms without holding a fork
+  ycc_vm:
+    token: {{ my_token }}
+    folder_id: b1gotqhf076hh183dn
+    name: "{{ inventory_hostname }}"
+    login: john_doe
+    public_ssh_key: john_doe_public_key
+    image_id: fd84uob96bu79jk8fqht
+    subnet_id: b0cccg656k0nixi92a
+    state: present
+    wait: false
+  register: created
+
+- name: Wait for all of them at once
+  ycc_operation:
+    token: {{ my_token }}
+    ids: "{{ ansible_play_hosts | map('extract', hostvars, ['created', 'operation_ids']) | select('defined') | flatten }}"
+    wait_timeout: 600
+  run_once: true
+
 - name: Stop vm
   ycc_vm:
     token: {{ my_token }}
@@ -298,6 +522,50 @@ message:
     description: The output message that the test module generates
     type: str
     returned: always
+instances:
+    description: Per-instance outcome keyed by instance name
+    type: dict
+    returned: when I(instances) is set
+operation_id:
+    description: Id of the first started operation
+    type: str
+    returned: when I(wait=false) and an operation was started
+operation_ids:
+    description: Ids of all started operations
+    type: list
+    returned: when I(wait=false) and an operation was started
+reconcile:
+    description:
+        - Differences of an existing instance by the way I(reconcile) applies them,
+          lists in_place, restart and recreate
+    type: dict
+    returned: when I(reconcile) is true and the instance exists
+updated:
+    description: Fields that update changed, empty when the instance already matched
+    type: list
+    returned: when I(operation=update) found the instance
+waits:
+    description: Operation id, number of polls and seconds waited for every waited operation
+    type: list
+    returned: when the module waited for cloud operations
+status_waits:
+    description:
+        - Instances found in a transitional status, with every status they went through,
+          seconds since the wait started when it was first seen, and seconds waited
+    type: list
+    returned: when the module waited for an instance status
+retries:
+    description:
+        - Retries of the task, total and by status code (QUOTA for the active operations limit),
+          seconds slept between them and the budget left
+    type: dict
+    returned: when any cloud call was retried or refused by the budget, or I(profile) is true
+timings:
+    description:
+        - Every cloud call with its method, status code, attempts and seconds,
+          every wait loop with its seconds, and their totals
+    type: dict
+    returned: when I(profile) is true
 """
 
 VMS_STATES = ["present", "absent"]
@@ -305,37 +573,49 @@ VMS_OPERATIONS = ["start", "stop", "get_info", "get_subnet_info", "update"]
 PLATFORM_IDS = ["Intel Cascade Lake", "Intel Broadwell", "Intel Ice Lake"]
 CORE_FRACTIONS = [5, 20, 50, 100]
 DISK_TYPES = ["hdd", "ssd", "ssd-nonreplicated"]
+# statuses _get_instance waits for, instances in others are changing
+SETTLED_STATUSES = ("RUNNING", "STOPPED")
+# a pinned image is kept for the whole run, runs are not expected to take longer
+PINNED_IMAGE_TTL = 24 * 60 * 60
+# differences that reconcile applies by stopping the instance around an Update
+RESTART_FIELDS = ("cores", "memory", "core_fraction", "platform_id", "preemptible")
 
 # pylint: disable=wrong-import-position
 import datetime
 import re
 import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from copy import deepcopy
 from enum import Enum
+from hashlib import sha1
 from json import dumps
-from time import sleep
+from threading import Lock
+from time import monotonic, sleep
 
 from ansible.module_utils.yc import (  # pylint: disable=E0611, E0401
     YC,
+    Backoff,
+    FileCache,
+    OperationError,
+    OperationSlots,
+    WaitTimeout,
+    is_quota_error,
+    list_items,
+    message_to_dict,
     response_error_check,
+    run_sync,
 )
 from google.protobuf.field_mask_pb2 import FieldMask
-from google.protobuf.json_format import MessageToDict
 from grpc import StatusCode
 from grpc._channel import _InactiveRpcError
-from jsonschema import validate
-from yandex.cloud.compute.v1.disk_service_pb2 import GetDiskRequest
-from yandex.cloud.compute.v1.disk_service_pb2_grpc import DiskServiceStub
-from yandex.cloud.compute.v1.image_service_pb2 import GetImageLatestByFamilyRequest
-from yandex.cloud.compute.v1.image_service_pb2_grpc import ImageServiceStub
-from yandex.cloud.vpc.v1.subnet_service_pb2_grpc import SubnetServiceStub
-from yandex.cloud.vpc.v1.subnet_service_pb2 import GetSubnetRequest
 from yandex.cloud.compute.v1.instance_pb2 import IPV4, SchedulingPolicy
 from yandex.cloud.compute.v1.instance_service_pb2 import (
     AttachedDiskSpec,
     CreateInstanceRequest,
     DeleteInstanceRequest,
     DnsRecordSpec,
+    GetInstanceRequest,
+    InstanceView,
     ListInstancesRequest,
     NetworkInterfaceSpec,
     OneToOneNatSpec,
@@ -347,12 +627,13 @@ from yandex.cloud.compute.v1.instance_service_pb2 import (
     UpdateInstanceNetworkInterfaceRequest,
 )
 from yandex.cloud.compute.v1.instance_service_pb2_grpc import InstanceServiceStub
-from yandex.cloud.compute.v1.snapshot_service_pb2 import GetSnapshotRequest
-from yandex.cloud.compute.v1.snapshot_service_pb2_grpc import SnapshotServiceStub
+
+# Stubs of other services and jsonschema are imported by the methods that use
+# them, so a task loads only what its operation needs.
 
 
 def vm_argument_spec():
-    return dict(
+    spec = dict(
         fqdn=dict(type="str"),
         name=dict(type="str"),
         folder_id=dict(type="str", required=True),
@@ -361,6 +642,7 @@ def vm_argument_spec():
         hostname=dict(type="str", required=False),
         zone_id=dict(type="str", required=False, default="ru-central1-a"),
         active_operations_limit_timeout=dict(type="int", required=False, default=None),
+        operation_slots=dict(type="int", required=False, default=0),
         platform_id=dict(
             type="str",
             choices=PLATFORM_IDS,
@@ -374,6 +656,8 @@ def vm_argument_spec():
         memory=dict(type="int", required=False, default=2),
         image_family=dict(type="str", required=False),
         image_folder=dict(type="list", required=False),
+        image_cache_ttl=dict(type="int", required=False, default=0),
+        pin_image_for_run=dict(type="str", required=False),
         image_id=dict(type="str", required=False),
         snapshot_id=dict(type="str", required=False),
         disk_type=dict(choices=DISK_TYPES, required=False, default="hdd"),
@@ -387,10 +671,38 @@ def vm_argument_spec():
         preemptible=dict(type="bool", required=False, default=False),
         metadata=dict(type="dict", required=False),
         labels=dict(type="dict", required=False),
+        description=dict(type="str", required=False),
         security_groups=dict(type="list", required=False),
         state=dict(choices=VMS_STATES, required=False),
         operation=dict(choices=VMS_OPERATIONS, required=False),
+        reconcile=dict(type="bool", required=False, default=False),
+        wait=dict(type="bool", required=False, default=True),
+        folder_snapshot=dict(type="bool", required=False, default=False),
+        folder_snapshot_ttl=dict(type="int", required=False, default=5),
+        page_size=dict(type="int", required=False, default=1000),
+        status_timeout=dict(type="int", required=False, default=60),
+    )
+    spec.update(
+        instances=dict(
+            type="list",
+            elements="dict",
+            required=False,
+            options=_override_spec(spec),
+        ),
+        max_concurrency=dict(type="int", required=False, default=10),
     )
+    return spec
+
+
+def _override_spec(spec):
+    """Spec for items of instances: any option may be set, nothing is required
+    and nothing has a default, so unset keys fall back to the top level.
+    """
+    return {
+        key: dict(option, required=False, default=None)
+        for key, option in spec.items()
+        if key not in ("state", "operation")
+    }
 
 
 MUTUALLY_EXCLUSIVE = (
@@ -400,9 +712,14 @@ MUTUALLY_EXCLUSIVE = (
     ("image_id", "image_family"),
     ("snapshot_id", "image_id"),
     ("snapshot_id", "image_family"),
+    ("instances", "operation"),
 )
 
-REQUIRED_ONE_OF = [("fqdn", "name")]
+REQUIRED_ONE_OF = [("fqdn", "name", "instances")]
+
+# keys of the top-level spec that identify a single vm and so are never
+# inherited by items of instances
+INSTANCE_IDENTITY_KEYS = ("name", "fqdn", "hostname", "assign_internal_ip")
 
 REQUIRED_TOGETHER = ("login", "public_ssh_key")
 
@@ -414,27 +731,56 @@ REQUIRED_IF = (
 
 
 class YccVM(YC):
+    RESOURCE_KEYS = ("instance", "response")
+    RESULT_MAPS = ("instances",)
+
     def __init__(self, **kwargs):
+        self.status_waits = list()
         super().__init__(**kwargs)
-        self.instance_service = self.sdk.client(InstanceServiceStub)
-        self.subnet_service = self.sdk.client(SubnetServiceStub)
-        self.disk_service = self.sdk.client(DiskServiceStub)
-        self.image_service = self.sdk.client(ImageServiceStub)
-        self.snapshot_service = self.sdk.client(SnapshotServiceStub)
-        if self.params.get("fqdn") and not self.params.get("name"):
-            self.params["name"] = self.params["fqdn"].split(".")[0]
-        if self.params.get("name"):
-            if not re.match("^[a-z][a-z0-9-]{1,61}[a-z0-9]$", self.params["name"]):
-                self.fail_json(
-                    msg=f'bad name {self.params["name"]}, see Yandex Cloud requirements for name'
-                )
-        if self.params.get("hostname"):
-            if not re.match("^(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z0-9][a-z0-9-]{0,61}[a-z0-9]$", self.params["hostname"]) and not re.match("^[a-z][a-z0-9-]{1,61}[a-z0-9]$", self.params["hostname"]):
-                self.fail_json(
-                    msg=f'bad hostname {self.params["hostname"]}, see Yandex Cloud requirements for hostname'
-                )
-        if self.params.get("fqdn") and self.params.get("fqdn")[-1] != ".":
-            self.params["fqdn"] = self.params["fqdn"] + "."
+        self.snapshot_cache = FileCache(
+            self.params["cache_dir"], self.params["folder_snapshot_ttl"]
+        )
+        self.snapshot_folders = set()
+        self.op_slots = None
+        if self.params["operation_slots"]:
+            self.op_slots = OperationSlots(
+                self.params["cache_dir"],
+                self.params.get("folder_id") or "default",
+                self.params["operation_slots"],
+            )
+        self.held_slots = dict()
+        self.held_slots_lock = Lock()
+        self.slot_poll_lock = Lock()
+        self.slot_polled_at = 0
+        try:
+            _normalize_names(self.params)
+        except ValueError as err:
+            self.fail_json(msg=str(err))
+
+    def _add_stats(self, result):
+        if self.status_waits:
+            result["status_waits"] = self.status_waits
+        super()._add_stats(result)
+
+    @property
+    def instance_service(self):
+        return self.aio.client(InstanceServiceStub)
+
+    @property
+    def subnet_service(self):
+        from yandex.cloud.vpc.v1.subnet_service_pb2_grpc import (  # pylint: disable=C0415
+            SubnetServiceStub,
+        )
+
+        return self.aio.client(SubnetServiceStub)
+
+    @property
+    def snapshot_service(self):
+        from yandex.cloud.compute.v1.snapshot_service_pb2_grpc import (  # pylint: disable=C0415
+            SnapshotServiceStub,
+        )
+
+        return self.aio.client(SnapshotServiceStub)
 
     def active_op_limit_timeout(self, timeout, fn, *args, **kwargs):
         """This funtion solves action operation queue cloud behaviour
@@ -442,18 +788,80 @@ class YccVM(YC):
         0 - wait infinite
         positive integer - wait seconds
         None - dont wait.
+
+        With operation_slots the call first takes a slot shared by every module
+        process on the controller and keeps it until the operation is done.
         """
+        slot = None
+        if self.op_slots:
+            started = monotonic()
+            slot = self.op_slots.acquire(timeout, self._release_done_slots)
+            self.record_loop("operation_slot", monotonic() - started)
+        try:
+            op = self._op_limit_retry(timeout, fn, *args, **kwargs)
+        except BaseException:
+            if slot:
+                slot.close()
+            raise
+        if slot:
+            with self.held_slots_lock:
+                self.held_slots[op.id] = slot
+        self._invalidate_snapshots()
+        return op
+
+    def _release_done_slots(self):
+        """Release slots of operations of this process that are done already,
+        a batch holds its slots until it starts waiting otherwise. Held
+        operations are polled by one waiting thread at a time and at most
+        every poll_interval seconds, the others only re-check slot files.
+        """
+        # pylint: disable=import-outside-toplevel
+        from yandex.cloud.operation.operation_service_pb2 import GetOperationRequest
+        from yandex.cloud.operation.operation_service_pb2_grpc import (
+            OperationServiceStub,
+        )
+
+        if not self.slot_poll_lock.acquire(blocking=False):
+            return
+        try:
+            if monotonic() - self.slot_polled_at < self.params["poll_interval"]:
+                return
+            with self.held_slots_lock:
+                held = list(self.held_slots)
+            if not held:
+                return
+            operations = run_sync(
+                self.aio.gather(
+                    OperationServiceStub,
+                    "Get",
+                    [
+                        GetOperationRequest(operation_id=operation_id)
+                        for operation_id in held
+                    ],
+                )
+            )
+            self.slot_polled_at = monotonic()
+        finally:
+            self.slot_poll_lock.release()
+        for operation in operations:
+            if operation.done:
+                with self.held_slots_lock:
+                    slot = self.held_slots.pop(operation.id, None)
+                if slot:
+                    slot.close()
+
+    def _op_limit_retry(self, timeout, fn, *args, **kwargs):
         if timeout is None:
             op = fn(*args, **kwargs)
         else:
             start_time = datetime.datetime.now()
-            retry = False
+            attempt = 0
             while (
                 timeout == 0 or (datetime.datetime.now() - start_time).seconds < timeout
             ):
                 try:
                     op = fn(*args, **kwargs)
-                    if retry:
+                    if attempt:
                         self.warn(
                             (
                                 f"{(datetime.datetime.now() - start_time).seconds}"
@@ -462,12 +870,11 @@ class YccVM(YC):
                         )
                     break
                 except _InactiveRpcError as err:
-                    if (
-                        "The limit on maximum number of active operations has exceeded"
-                        in err._state.details  # pylint: disable=W0212
-                    ):
-                        sleep(5)
-                        retry = True
+                    if is_quota_error(err):
+                        self.retry_policy.count("QUOTA")
+                        delay = self.retry_policy.sleep(attempt)
+                        self.record_loop("active_op_limit", delay)
+                        attempt += 1
                     else:
                         raise err
             else:
@@ -476,34 +883,138 @@ class YccVM(YC):
                 )
         return op
 
+    def wait_each(self, operations, on_missing=None):
+        for operation in super().wait_each(operations, on_missing):
+            self._invalidate_snapshots()
+            with self.held_slots_lock:
+                slot = self.held_slots.pop(operation.id, None)
+            if slot:
+                slot.close()
+            yield operation
+
     def _list_by_name(self, name, folder_id):
-        instances = self.instance_service.List(
-            ListInstancesRequest(folder_id=folder_id, filter='name="%s"' % name)
+        """Instance with this name, None if there is none."""
+        if self.params["folder_snapshot"]:
+            return self._folder_snapshot(folder_id).get(name)
+        instances = list_items(
+            self.instance_service,
+            ListInstancesRequest(folder_id=folder_id, filter='name="%s"' % name),
+            "instances",
+            self.params["page_size"],
+        )
+        for instance in instances:
+            if instance.name == name:
+                return message_to_dict(instance)
+        return None
+
+    def _folder_snapshot(self, folder_id):
+        """All instances of the folder by name, listed once per
+        folder_snapshot_ttl for every module process on the controller.
+        """
+        self.snapshot_folders.add(folder_id)
+        return self.snapshot_cache.get(
+            "instances-%s" % folder_id, lambda: self._list_folder(folder_id)
         )
-        return MessageToDict(instances)
+
+    def _list_folder(self, folder_id):
+        instances = list_items(
+            self.instance_service,
+            ListInstancesRequest(folder_id=folder_id),
+            "instances",
+            self.params["page_size"],
+        )
+        return {instance.name: message_to_dict(instance) for instance in instances}
+
+    def _invalidate_snapshots(self):
+        """Drop snapshots of folders this task looked at, every mutating call
+        goes after an instance from one of them.
+        """
+        for folder_id in list(self.snapshot_folders):
+            self.snapshot_cache.invalidate("instances-%s" % folder_id)
 
     def _get_instance(self, name, folder_id):
-        valid_statuses = ("RUNNING", "STOPPED")
-        timeout = 60
-        step = 5
-        timer = 0
-        while timer < timeout:
-            instance = self._list_by_name(name, folder_id)
-            if not instance or (
-                instance.get("instances", ({},))[0].get("status") in valid_statuses
-            ):
-                break
-            if instance.get("instances", ({},))[0].get("status") == "ERROR":
-                raise Exception("Instance status is ERROR")
-            sleep(step)
-            timer += step
-        else:
-            raise TimeoutError("Wait for instance status exceeded")
-        return instance.get("instances", (None,))[0]
+        """Instance with this name, None if there is none. An instance in a
+        transitional status is watched until it is RUNNING or STOPPED.
+        """
+        instance = self._list_by_name(name, folder_id)
+        if instance and instance.get("status") not in SETTLED_STATUSES:
+            instance = self._watch_status(instance)
+        return instance
+
+    def _watch_status(self, instance):
+        """Get the instance by id with backoff until its status settles,
+        None if it is deleted meanwhile. Every status it went through is
+        added to status_waits with seconds since the watch started.
+        """
+        backoff = Backoff(
+            self.params["poll_interval"],
+            self.params["poll_max_interval"],
+            self.params["poll_multiplier"],
+            self.params["poll_jitter"],
+            self.params["status_timeout"],
+        )
+        delays = backoff.delays()
+        name, instance_id = instance["name"], instance["id"]
+        history = [dict(status=instance.get("status"), at=0.0)]
+        try:
+            while instance and instance.get("status") not in SETTLED_STATUSES:
+                if instance.get("status") == "ERROR":
+                    raise Exception("Instance status is ERROR")
+                try:
+                    sleep(next(delays))
+                except WaitTimeout:
+                    raise WaitTimeout(
+                        "Wait for instance %s status exceeded %s seconds, it is %s"
+                        % (name, self.params["status_timeout"], instance.get("status"))
+                    ) from None
+                instance = self._get_by_id(instance_id)
+                status = instance.get("status") if instance else "DELETED"
+                if status != history[-1]["status"]:
+                    history.append(dict(status=status, at=round(backoff.elapsed(), 3)))
+        finally:
+            waited = backoff.elapsed()
+            self.status_waits.append(
+                dict(
+                    name=name,
+                    instance_id=instance_id,
+                    history=history,
+                    waited=round(waited, 3),
+                )
+            )
+            self.record_loop(
+                "instance_status", waited, name=name, instance_id=instance_id
+            )
+        return instance
+
+    def _get_by_id(self, instance_id):
+        try:
+            return message_to_dict(
+                self.instance_service.Get(GetInstanceRequest(instance_id=instance_id))
+            )
+        except _InactiveRpcError as err:
+            if err.code() is StatusCode.NOT_FOUND:
+                return None
+            raise
+
+    def _get_disks(self, disk_ids):
+        """Fetch all disks at the same time, returns them by id."""
+        # pylint: disable=import-outside-toplevel
+        from yandex.cloud.compute.v1.disk_service_pb2 import GetDiskRequest
+        from yandex.cloud.compute.v1.disk_service_pb2_grpc import DiskServiceStub
+
+        disks = run_sync(
+            self.aio.gather(
+                DiskServiceStub,
+                "Get",
+                [GetDiskRequest(disk_id=disk_id) for disk_id in disk_ids],
+            )
+        )
+        return {
+            disk_id: message_to_dict(disk) for disk_id, disk in zip(disk_ids, disks)
+        }
 
-    def _compare_disk(self, disk_id, disk_spec):
+    def _compare_disk(self, disk, disk_spec):
         err = list()
-        disk = MessageToDict(self.disk_service.Get(GetDiskRequest(disk_id=disk_id)))
         if disk_spec["type"] != disk["typeId"]:
             err.append("type")
 
@@ -563,13 +1074,21 @@ class YccVM(YC):
         ):
             err.append("preemptible")
 
+        # fetch boot and secondary disks in one round trip
+        disks = self._get_disks(
+            [instance["bootDisk"]["diskId"]]
+            + [disk["diskId"] for disk in instance.get("secondaryDisks", [])]
+        )
+
         # prepare boot_disk_spec
         boot_disk_spec = {
             "type": spec["disk_type"],
             "size": spec["disk_size"],
             "image_id": spec["image_id"],
         }
-        err.extend(self._compare_disk(instance["bootDisk"]["diskId"], boot_disk_spec))
+        err.extend(
+            self._compare_disk(disks[instance["bootDisk"]["diskId"]], boot_disk_spec)
+        )
 
         if spec.get("secondary_disks_spec") and not instance.get("secondaryDisks"):
             err.append("secondary_disk not presented on instance")
@@ -587,7 +1106,7 @@ class YccVM(YC):
                     fault_keys.append("autodelete")
                 fault_keys.extend(
                     self._compare_disk(
-                        disk["diskId"], spec["secondary_disks_spec"][idx]
+                        disks[disk["diskId"]], spec["secondary_disks_spec"][idx]
                     )
                 )
                 if fault_keys:
@@ -603,14 +1122,14 @@ class YccVM(YC):
 
         return err
 
-    def _translate(self):
+    def _translate(self, spec):
         """This funtion must convert all GB values to bytes as ycc api needs.
         Human readable disk type and platform id to api types.
 
-        :param params: [description]
-        :type params: [type]
+        :param spec: module params or a merged item of instances
+        :type spec: dict
         """
-        params = deepcopy(self.params)
+        params = deepcopy(spec)
         for key in params:
             if key in ["memory", "disk_size"]:
                 params[key] = params[key] * 2 ** 30
@@ -630,7 +1149,7 @@ class YccVM(YC):
                         disk["size"] = disk["size"] * 2 ** 30
 
         if params.get("image_family"):
-            params["image_id"] = self._get_image_by_family()
+            params["image_id"] = self._get_image_by_family(params)
         elif params.get("image_id") or params.get("snapshot_id"):
             pass
         else:
@@ -638,38 +1157,60 @@ class YccVM(YC):
 
         return params
 
-    def _get_image_by_family(self):
+    def _get_image_by_family(self, spec):
 
-        folders = self.params.get("image_folder")
+        folders = spec.get("image_folder")
         if not folders:
-            folders = ["standard-images", self.params["folder_id"]]
-
-        for folder in folders:
-            try:
-                image_id = self.image_service.GetLatestByFamily(
-                    GetImageLatestByFamilyRequest(
-                        folder_id=folder, family=self.params["image_family"]
-                    )
-                ).id
-                break
-            except _InactiveRpcError as err:
-                if (
-                    err._state.code  # pylint: disable=protected-access
-                    is not StatusCode.NOT_FOUND
-                ):
-                    raise err
+            folders = ["standard-images", spec["folder_id"]]
+        family = spec["image_family"]
+
+        key = "image-%s" % sha1(dumps([family, folders]).encode("utf-8")).hexdigest()
+        if spec.get("pin_image_for_run"):
+            cache = FileCache(self.params["cache_dir"], PINNED_IMAGE_TTL)
+            key = "%s-%s" % (key, spec["pin_image_for_run"])
+        elif spec.get("image_cache_ttl"):
+            cache = FileCache(self.params["cache_dir"], spec["image_cache_ttl"])
         else:
-            raise ImageFamilyNotFound
+            return self._find_image(family, folders)
+        return cache.get(key, lambda: self._find_image(family, folders))
 
-        return image_id
+    def _find_image(self, family, folders):
+        """Probe all folders at the same time, the earliest folder in the list
+        that has the family wins.
+        """
+        # pylint: disable=import-outside-toplevel
+        from yandex.cloud.compute.v1.image_service_pb2 import (
+            GetImageLatestByFamilyRequest,
+        )
+        from yandex.cloud.compute.v1.image_service_pb2_grpc import ImageServiceStub
+
+        images = run_sync(
+            self.aio.gather(
+                ImageServiceStub,
+                "GetLatestByFamily",
+                [
+                    GetImageLatestByFamilyRequest(folder_id=folder, family=family)
+                    for folder in folders
+                ],
+                return_exceptions=True,
+            )
+        )
+        for image in images:
+            if not isinstance(image, Exception):
+                return image.id
+            if not (
+                isinstance(image, _InactiveRpcError)
+                and image._state.code  # pylint: disable=protected-access
+                is StatusCode.NOT_FOUND
+            ):
+                raise image
+        raise ImageFamilyNotFound
 
     def _get_instance_params(self, spec):  # pylint: disable=R0914
         name = spec.get("name")
         fqdn = spec.get("fqdn")
         folder_id = spec.get("folder_id")
-        login = spec.get("login")
         hostname = spec.get("hostname") if spec.get("hostname") else spec.get("name")
-        public_ssh_key = spec.get("public_ssh_key")
         zone_id = spec.get("zone_id")
         platform_id = spec.get("platform_id")
         core_fraction = spec.get("core_fraction")
@@ -685,12 +1226,17 @@ class YccVM(YC):
         assign_public_ip = spec.get("assign_public_ip")
         assign_internal_ip = spec.get("assign_internal_ip")
         preemptible = spec.get("preemptible")
-        metadata = spec.get("metadata")
+        metadata = _get_metadata(spec)
         labels = spec.get("labels")
+        description = spec.get("description")
         security_groups = spec.get("security_groups")
         disk_name = spec.get("disk_name")  # CST-965: added disk_name parameter to boot disk for Grafana dashboards
 
         if snapshot_id:
+            from yandex.cloud.compute.v1.snapshot_service_pb2 import (  # pylint: disable=C0415
+                GetSnapshotRequest,
+            )
+
             try:
                 self.snapshot_service.Get(GetSnapshotRequest(snapshot_id=snapshot_id))
             except _InactiveRpcError as err:
@@ -722,21 +1268,8 @@ class YccVM(YC):
             params["metadata"] = metadata
         if labels:
             params["labels"] = labels
-
-        if login and public_ssh_key:
-            params["metadata"] = {
-                "user-data": (
-                    "#cloud-config\n"
-                    'datasource: { Ec2: { strict_id: false, ssh_pwauth: "no" } }\n'
-                    "users: [{\n"
-                    '   name: "%s",\n'
-                    '   sudo: "ALL=(ALL) NOPASSWD:ALL",\n'
-                    '   shell: "/bin/bash",\n'
-                    '   ssh-authorized-keys: ["%s"]\n'
-                    "}]"
-                )
-                % (login, public_ssh_key)
-            }
+        if description:
+            params["description"] = description
         return params
 
     def manage_states(self):
@@ -744,7 +1277,9 @@ class YccVM(YC):
             "present": self.add_vm,
             "absent": self.delete_vm,
         }
-        return sw[self.params.get("state")]()
+        handler = sw[self.params.get("state")]
+        with self.span(handler.__name__):
+            return handler()
 
     def manage_operations(self):
         sw = {
@@ -754,13 +1289,106 @@ class YccVM(YC):
             "get_subnet_info": self.get_subnet_info,
             "update": self.update_vm,
         }
-        return sw[self.params.get("operation")]()
+        handler = sw[self.params.get("operation")]
+        with self.span(handler.__name__):
+            return handler()
+
+    def _instance_spec(self, item):
+        """Merge an item of instances over the top-level params."""
+        spec = deepcopy(self.params)
+        spec.pop("instances")
+        for key in INSTANCE_IDENTITY_KEYS:
+            spec[key] = None
+        spec.update({key: value for key, value in item.items() if value is not None})
+        _normalize_names(spec)
+        if not spec.get("name"):
+            raise ValueError(
+                "one of name or fqdn should be provided for every instance"
+            )
+        return spec
+
+    def _batch(self, submit, finish):
+        """Process every item of instances in a bounded worker pool.
+
+        All requests are submitted first, then the resulting operations are
+        polled together in one loop, so the whole batch takes about as long
+        as its slowest instance.
+        """
+        specs = [self._instance_spec(item) for item in self.params["instances"]]
+        names = [spec["name"] for spec in specs]
+        if len(set(names)) != len(names):
+            raise ValueError("instance names in instances should be unique")
+
+        results = dict()
+        operations = dict()
+        spans = {
+            spec["name"]: self.tracer.start(
+                "instance", name=spec["name"], folder_id=spec.get("folder_id")
+            )
+            for spec in specs
+        }
+        with ThreadPoolExecutor(max_workers=self.params["max_concurrency"]) as pool:
+            submitted = dict()
+            for spec in specs:
+                future = pool.submit(self._in_span, spans[spec["name"]], submit, spec)
+                submitted[future] = spec["name"]
+            for future in as_completed(submitted):
+                name = submitted[future]
+                try:
+                    results[name], operation = future.result()
+                except Exception as error:  # pylint: disable=broad-except
+                    results[name] = _batch_error(error)
+                    continue
+                if operation is not None:
+                    spans[name].attributes["operation_id"] = operation.id
+                    operations[operation.id] = (name, operation)
+
+        if not self.params["wait"]:
+            for name, operation in operations.values():
+                results[name] = _submitted(results[name], [operation])
+            operations = dict()
+
+        try:
+            for done in self.wait_each([op for _, op in operations.values()]):
+                name, _ = operations.pop(done.id)
+                results[name] = self._in_span(spans[name], finish, results[name], done)
+        except WaitTimeout as error:
+            for name, _ in operations.values():
+                results[name] = _batch_error(error)
+
+        for name, span in spans.items():
+            span.end(results[name].get("msg") if results[name].get("failed") else None)
+
+        response = dict(instances=results)
+        response["changed"] = any(result.get("changed") for result in results.values())
+        failed = sorted(
+            name for name, result in results.items() if result.get("failed")
+        )
+        if failed:
+            response["failed"] = True
+            response["msg"] = "Failed instances: %s" % ", ".join(failed)
+        return response
+
+    def _in_span(self, span, fn, *args):
+        with self.tracer.activate(span):
+            return fn(*args)
 
     def add_vm(self):
-        spec = self._translate()
+        if self.params.get("instances"):
+            return self._batch(self._submit_create, self._finish_create)
+        response, operation = self._submit_create(self.params)
+        if operation is not None and not self.params["wait"]:
+            return _submitted(response, [operation])
+        if operation is not None:
+            response = self._finish_create(response, self.waiter(operation))
+        return response
+
+    def _submit_create(self, params):
+        spec = self._translate(params)
         response = dict()
         response["changed"] = False
-        sec_disk = self.params.get("secondary_disks")
+        operation = None
+        sec_disk = params.get("secondary_disks")
         if sec_disk:
             schema = {
                 "type": "array",
@@ -794,13 +1422,19 @@ class YccVM(YC):
                     ],
                 },
             }
+            from jsonschema import validate  # pylint: disable=C0415
+
             validate(instance=sec_disk, schema=schema)
-        name = self.params.get("name")
-        folder_id = self.params.get("folder_id")
+        name = params.get("name")
+        folder_id = params.get("folder_id")
         instance = self._get_instance(name, folder_id)
         if instance:
             compare_result = self._is_same(instance, spec)
-            if compare_result:
+            if params.get("reconcile"):
+                response, operation = self._submit_reconcile(
+                    instance, spec, compare_result
+                )
+            elif compare_result:
                 response["failed"] = True
                 response["msg"] = (
                     "Instance already exits and %s"
@@ -811,72 +1445,199 @@ class YccVM(YC):
                 response["failed"] = False
                 response["changed"] = False
         else:
-            params = self._get_instance_params(spec)
             operation = self.active_op_limit_timeout(
-                self.params.get("active_operations_limit_timeout"),
+                params.get("active_operations_limit_timeout"),
                 self.instance_service.Create,
-                CreateInstanceRequest(**params),
+                CreateInstanceRequest(**self._get_instance_params(spec)),
             )
-            cloud_response = self.waiter(operation)
-            response.update(MessageToDict(cloud_response))
-            response = response_error_check(response)
-        return response
+        return response, operation
+
+    def _submit_reconcile(self, instance, spec, differences):
+        """Bring an existing instance to spec the cheapest way: in-place fields
+        and restart fields go into one Update, the instance is stopped around
+        it only if a restart field changed. Differences that need recreation
+        fail the instance. Returns the response and the last operation.
+        """
+        response = dict(changed=False)
+        timeout = spec.get("active_operations_limit_timeout")
+        request = self._update_request(instance, spec)
+        in_place = list(request.update_mask.paths)
+        restart = _add_restart_fields(request, instance, spec)
+        nic_requests = _network_interface_updates(instance, spec.get("security_groups"))
+        if nic_requests:
+            in_place.append("security_groups")
+        recreate = [
+            str(difference)
+            for difference in differences
+            if not isinstance(difference, dict) and difference not in RESTART_FIELDS
+        ]
+        response["reconcile"] = dict(
+            in_place=in_place, restart=restart, recreate=recreate
+        )
+        if recreate:
+            response["failed"] = True
+            response["msg"] = (
+                "Instance already exits and %s can be changed only by recreating it"
+                % ", ".join(recreate)
+            )
+            return response, None
+        if not (request.update_mask.paths or nic_requests):
+            response["response"] = instance
+            return response, None
+
+        stopped, start = False, None
+        if restart and instance["status"] == "RUNNING":
+            stop = self.waiter(
+                self.active_op_limit_timeout(
+                    timeout,
+                    self.instance_service.Stop,
+                    StopInstanceRequest(instance_id=instance["id"]),
+                )
+            )
+            if stop.HasField("error"):
+                raise OperationError(stop)
+            stopped = True
+        operations = list()
+        try:
+            if request.update_mask.paths:
+                operations.append(
+                    self.active_op_limit_timeout(
+                        timeout, self.instance_service.Update, request
+                    )
+                )
+            for nic_request in nic_requests:
+                operations.append(
+                    self.active_op_limit_timeout(
+                        timeout,
+                        self.instance_service.UpdateNetworkInterface,
+                        nic_request,
+                    )
+                )
+            if stopped:
+                self.wait_all(operations)
+        finally:
+            # a failed update must not leave a running instance stopped
+            if stopped:
+                start = self.active_op_limit_timeout(
+                    timeout,
+                    self.instance_service.Start,
+                    StartInstanceRequest(instance_id=instance["id"]),
+                )
+        if not stopped:
+            self.wait_all(operations[1:])
+            return response, operations[0]
+        return response, start
+
+    def _finish_create(self, response, cloud_response):
+        response.update(message_to_dict(cloud_response))
+        return response_error_check(response)
 
     def delete_vm(self):
+        if self.params.get("instances"):
+            return self._batch(self._submit_delete, self._finish_delete)
+        response, operation = self._submit_delete(self.params)
+        if operation is not None and not self.params["wait"]:
+            return _submitted(response, [operation])
+        if operation is not None:
+            response = self._finish_delete(response, self.waiter(operation))
+        return response
+
+    def _submit_delete(self, params):
         response = dict()
         response["changed"] = False
-        name = self.params.get("name")
-        folder_id = self.params.get("folder_id")
+        operation = None
+        name = params.get("name")
+        folder_id = params.get("folder_id")
         instance = self._get_instance(name, folder_id)
         if instance:
             operation = self.active_op_limit_timeout(
-                self.params.get("active_operations_limit_timeout"),
+                params.get("active_operations_limit_timeout"),
                 self.instance_service.Delete,
                 DeleteInstanceRequest(instance_id=instance["id"]),
             )
-            cloud_response = self.waiter(operation)
+        return response, operation
 
-            response["response"] = MessageToDict(cloud_response)
-            response = response_error_check(response)
-        return response
+    def _finish_delete(self, response, cloud_response):
+        response["response"] = message_to_dict(cloud_response)
+        return response_error_check(response)
 
     def update_vm(self):
+        """Apply labels, metadata, description and security groups that differ
+        from the instance: one Update with a mask of the changed fields plus an
+        UpdateNetworkInterface for every interface whose groups changed.
+        Nothing is called when nothing differs.
+        """
         response = dict()
         name = self.params.get("name")
         folder_id = self.params.get("folder_id")
-        labels = self.params.get("labels")
-        security_groups = self.params.get("security_groups")
         instance = self._get_instance(name, folder_id)
-        protobuf_field_labels_mask = FieldMask(paths=["labels"])
-        protobuf_field_sg_mask = FieldMask(paths=["security_group_ids"])
-        if instance:
-            update_labels_operation = self.active_op_limit_timeout(
-                self.params.get("active_operations_limit_timeout"),
-                self.instance_service.Update,
-                UpdateInstanceRequest(
-                    instance_id=instance["id"],
-                    labels=labels,
-                    update_mask=protobuf_field_labels_mask,
-                ),
+        if not instance:
+            response["msg"] = "Update instance is missing"
+            return response_error_check(response)
+        updated, operations = self._submit_updates(instance, self.params)
+        response["updated"] = updated
+        if not operations:
+            response["response"] = instance
+            response["changed"] = False
+            return response
+        if not self.params["wait"]:
+            return _submitted(response, operations)
+        cloud_response = self.wait_all(operations)[0]
+        response["response"] = message_to_dict(cloud_response)
+        return response_error_check(response)
+
+    def _submit_updates(self, instance, spec):
+        """Start operations that apply in-place fields of spec to instance,
+        returns names of the changed fields and the operations.
+        """
+        timeout = spec.get("active_operations_limit_timeout")
+        updated, operations = list(), list()
+        request = self._update_request(instance, spec)
+        if request.update_mask.paths:
+            updated.extend(request.update_mask.paths)
+            operations.append(
+                self.active_op_limit_timeout(
+                    timeout, self.instance_service.Update, request
+                )
             )
-            update_sg_operation = self.active_op_limit_timeout(
-                self.params.get("active_operations_limit_timeout"),
-                self.instance_service.UpdateNetworkInterface,
-                UpdateInstanceNetworkInterfaceRequest(
-                    instance_id=instance["id"],
-                    network_interface_index = "0",
-                    update_mask=protobuf_field_sg_mask,
-                    security_group_ids=security_groups,
-                ),
+        nic_requests = _network_interface_updates(instance, spec.get("security_groups"))
+        if nic_requests:
+            updated.append("security_groups")
+        for nic_request in nic_requests:
+            operations.append(
+                self.active_op_limit_timeout(
+                    timeout, self.instance_service.UpdateNetworkInterface, nic_request
+                )
             )
-            sg_cloud_response = self.waiter(update_sg_operation)
-            labels_cloud_response = self.waiter(update_labels_operation)
-            response["response"] = MessageToDict(sg_cloud_response)
-            response = response_error_check(response)
-        else:
-            response["msg"] = "Update instance is missing"
-            response = response_error_check(response)
-        return response
+        return updated, operations
+
+    def _update_request(self, instance, spec):
+        """UpdateInstanceRequest masked to the fields of spec that differ from
+        instance, fields that spec does not set are left as they are.
+        """
+        request = UpdateInstanceRequest(instance_id=instance["id"])
+        labels = spec.get("labels")
+        if labels is not None and labels != instance.get("labels", {}):
+            request.labels.update(labels)
+            request.update_mask.paths.append("labels")
+        description = spec.get("description")
+        if description is not None and description != instance.get("description", ""):
+            request.description = description
+            request.update_mask.paths.append("description")
+        metadata = _get_metadata(spec)
+        if metadata is not None and metadata != self._instance_metadata(instance):
+            request.metadata.update(metadata)
+            request.update_mask.paths.append("metadata")
+        return request
+
+    def _instance_metadata(self, instance):
+        """Metadata of instance, List leaves it out, so it may take a Get."""
+        if "metadata" in instance:
+            return instance["metadata"]
+        full = self.instance_service.Get(
+            GetInstanceRequest(instance_id=instance["id"], view=InstanceView.FULL)
+        )
+        return dict(full.metadata)
 
     def start_vm(self):
         response = dict()
@@ -891,9 +1652,11 @@ class YccVM(YC):
                     self.instance_service.Start,
                     StartInstanceRequest(instance_id=instance["id"]),
                 )
+                if not self.params["wait"]:
+                    return _submitted(response, [operation])
                 cloud_response = self.waiter(operation)
 
-                response["response"] = MessageToDict(cloud_response)
+                response["response"] = message_to_dict(cloud_response)
                 response = response_error_check(response)
             elif instance["status"] != "RUNNING":
                 response["failed"] = True
@@ -920,9 +1683,11 @@ class YccVM(YC):
                     self.instance_service.Stop,
                     StopInstanceRequest(instance_id=instance["id"]),
                 )
+                if not self.params["wait"]:
+                    return _submitted(response, [operation])
                 cloud_response = self.waiter(operation)
 
-                response["response"] = MessageToDict(cloud_response)
+                response["response"] = message_to_dict(cloud_response)
                 response = response_error_check(response)
             elif instance["status"] != "STOPPED":
                 response["failed"] = True
@@ -948,9 +1713,15 @@ class YccVM(YC):
         return response
 
     def get_subnet_info(self):
+        from yandex.cloud.vpc.v1.subnet_service_pb2 import (  # pylint: disable=C0415
+            GetSubnetRequest,
+        )
+
         response = dict()
         subnet_id = self.params.get("subnet_id")
-        response["subnet_info"] = MessageToDict(self.subnet_service.Get(GetSubnetRequest(subnet_id=subnet_id)))
+        response["subnet_info"] = message_to_dict(
+            self.subnet_service.Get(GetSubnetRequest(subnet_id=subnet_id))
+        )
         return response
 
 
@@ -970,6 +1741,48 @@ class DiskType(Enum):
     SSD_NONREPLICATED = "network-ssd-nonreplicated"
 
 
+def _submitted(response, operations):
+    """Response of a call that started operations and did not wait for them."""
+    response["operation_id"] = operations[0].id
+    response["operation_ids"] = [operation.id for operation in operations]
+    response["changed"] = True
+    return response
+
+
+def _batch_error(error):
+    if hasattr(error, "details"):
+        msg = getattr(error, "details")()
+    else:
+        msg = str(error) or error.__class__.__name__
+    return dict(changed=False, failed=True, msg=msg)
+
+
+def _normalize_names(spec):
+    """Derive name from fqdn, check name and hostname against Yandex Cloud
+    requirements and make fqdn absolute. Raises ValueError on a bad value.
+    """
+    if spec.get("fqdn") and not spec.get("name"):
+        spec["name"] = spec["fqdn"].split(".")[0]
+    if spec.get("name"):
+        if not re.match("^[a-z][a-z0-9-]{1,61}[a-z0-9]$", spec["name"]):
+            raise ValueError(
+                f'bad name {spec["name"]}, see Yandex Cloud requirements for name'
+            )
+    if spec.get("hostname"):
+        if (
+            not re.match(
+                "^(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\\.)+[a-z0-9][a-z0-9-]{0,61}[a-z0-9]$",
+                spec["hostname"],
+            )
+            and not re.match("^[a-z][a-z0-9-]{1,61}[a-z0-9]$", spec["hostname"])
+        ):
+            raise ValueError(
+                f'bad hostname {spec["hostname"]}, see Yandex Cloud requirements for hostname'
+            )
+    if spec.get("fqdn") and spec.get("fqdn")[-1] != ".":
+        spec["fqdn"] = spec["fqdn"] + "."
+
+
 def _camel(snake_case):
     first, *others = snake_case.split("_")
     return "".join([first.lower(), *map(str.title, others)])
@@ -1051,6 +1864,82 @@ def _get_secondary_network_interface_spec(secondary_subnet_id, security_groups):
     return net_sec_spec
 
 
+def _get_metadata(spec):
+    """Metadata the instance should have: metadata of spec or cloud-config
+    user-data made of login and public_ssh_key, None if spec sets neither.
+    """
+    if spec.get("login") and spec.get("public_ssh_key"):
+        return {
+            "user-data": (
+                "#cloud-config\n"
+                'datasource: { Ec2: { strict_id: false, ssh_pwauth: "no" } }\n'
+                "users: [{\n"
+                '   name: "%s",\n'
+                '   sudo: "ALL=(ALL) NOPASSWD:ALL",\n'
+                '   shell: "/bin/bash",\n'
+                '   ssh-authorized-keys: ["%s"]\n'
+                "}]"
+            )
+            % (spec["login"], spec["public_ssh_key"])
+        }
+    return spec.get("metadata")
+
+
+def _add_restart_fields(request, instance, spec):
+    """Add fields of a translated spec that differ from instance and can be
+    changed only while it is stopped to an UpdateInstanceRequest, returns
+    their names.
+    """
+    changed = list()
+    resources = instance.get("resources", {})
+    for key, field in (
+        ("cores", "cores"),
+        ("memory", "memory"),
+        ("core_fraction", "coreFraction"),
+    ):
+        if spec.get(key) is not None and spec[key] != int(resources.get(field, 0)):
+            changed.append(key)
+    if changed:
+        request.resources_spec.CopyFrom(
+            _get_resource_spec(
+                spec.get("memory") or int(resources.get("memory", 0)),
+                spec.get("cores") or int(resources.get("cores", 0)),
+                spec.get("core_fraction") or int(resources.get("coreFraction", 0)),
+            )
+        )
+        request.update_mask.paths.append("resources_spec")
+    if spec.get("platform_id") and spec["platform_id"] != instance.get("platformId"):
+        request.platform_id = spec["platform_id"]
+        request.update_mask.paths.append("platform_id")
+        changed.append("platform_id")
+    preemptible = instance.get("schedulingPolicy", {}).get("preemptible", False)
+    if spec.get("preemptible") is not None and spec["preemptible"] != preemptible:
+        request.scheduling_policy.preemptible = spec["preemptible"]
+        request.update_mask.paths.append("scheduling_policy.preemptible")
+        changed.append("preemptible")
+    return changed
+
+
+def _network_interface_updates(instance, security_groups):
+    """UpdateInstanceNetworkInterfaceRequest for every interface of instance
+    whose security groups differ, none if security_groups is None.
+    """
+    if security_groups is None:
+        return []
+    requests = list()
+    for index, interface in enumerate(instance.get("networkInterfaces", [])):
+        if set(interface.get("securityGroupIds", [])) != set(security_groups):
+            requests.append(
+                UpdateInstanceNetworkInterfaceRequest(
+                    instance_id=instance["id"],
+                    network_interface_index=interface.get("index", str(index)),
+                    update_mask=FieldMask(paths=["security_group_ids"]),
+                    security_group_ids=security_groups,
+                )
+            )
+    return requests
+
+
 def _get_scheduling_policy(preemptible):
     return SchedulingPolicy(preemptible=preemptible)
 
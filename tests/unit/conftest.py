@@ -0,0 +1,25 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Makes ansible.module_utils.yc and the modules importable from the tree,
+the way the controller does for a role or a playbook with library paths.
+"""
+
+import os
+import sys
+
+import ansible.module_utils
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ansible.module_utils.__path__.append(os.path.join(ROOT, "module_utils"))
+sys.path.insert(0, os.path.join(ROOT, "modules"))
@@ -0,0 +1,218 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+
+import pytest
+from ansible.module_utils.yc import message_to_dict  # pylint: disable=E0611, E0401
+from google.protobuf import descriptor_pb2, descriptor_pool, message_factory
+from google.protobuf.any_pb2 import Any
+from google.protobuf.duration_pb2 import Duration
+from google.protobuf.field_mask_pb2 import FieldMask
+from google.protobuf.json_format import MessageToDict
+from google.protobuf.struct_pb2 import Struct, Value
+from google.protobuf.timestamp_pb2 import Timestamp
+from google.protobuf.wrappers_pb2 import Int64Value
+from yandex.cloud.compute.v1.disk_pb2 import Disk
+from yandex.cloud.compute.v1.instance_pb2 import (
+    AttachedDisk,
+    Instance,
+    NetworkInterface,
+    OneToOneNat,
+    PrimaryAddress,
+    Resources,
+)
+from yandex.cloud.compute.v1.instance_service_pb2 import (
+    CreateInstanceMetadata,
+    UpdateInstanceRequest,
+)
+from yandex.cloud.operation.operation_pb2 import Operation
+from yandex.cloud.vpc.v1.subnet_pb2 import Subnet
+
+
+def sample_class():
+    """Message with a field of every kind message_to_dict converts on its own,
+    built from a descriptor as there is no protoc to compile a .proto.
+    """
+    file_proto = descriptor_pb2.FileDescriptorProto(
+        name="yc_test_sample.proto",
+        package="yc.test",
+        syntax="proto3",
+        dependency=[
+            "google/protobuf/struct.proto",
+            "google/protobuf/wrappers.proto",
+            "google/protobuf/duration.proto",
+        ],
+    )
+    message = file_proto.message_type.add(name="Sample")
+    message.enum_type.add(name="Kind").value.extend(
+        [
+            descriptor_pb2.EnumValueDescriptorProto(name="KIND_UNSPECIFIED", number=0),
+            descriptor_pb2.EnumValueDescriptorProto(name="SMALL", number=1),
+        ]
+    )
+    field = descriptor_pb2.FieldDescriptorProto
+    optional, repeated = field.LABEL_OPTIONAL, field.LABEL_REPEATED
+
+    def entry(name, key_type, value_type, type_name=None):
+        nested = message.nested_type.add(name=name)
+        nested.options.map_entry = True
+        nested.field.add(name="key", number=1, type=key_type, label=optional)
+        value = nested.field.add(
+            name="value", number=2, type=value_type, label=optional
+        )
+        if type_name:
+            value.type_name = type_name
+        return ".yc.test.Sample." + name
+
+    fields = [
+        ("d", field.TYPE_DOUBLE, optional, None),
+        ("f", field.TYPE_FLOAT, optional, None),
+        ("b", field.TYPE_BYTES, optional, None),
+        ("i", field.TYPE_INT64, optional, None),
+        ("u", field.TYPE_UINT64, optional, None),
+        ("flag", field.TYPE_BOOL, optional, None),
+        (
+            "by_flag",
+            field.TYPE_MESSAGE,
+            repeated,
+            entry("ByFlagEntry", field.TYPE_BOOL, field.TYPE_STRING),
+        ),
+        (
+            "by_number",
+            field.TYPE_MESSAGE,
+            repeated,
+            entry(
+                "ByNumberEntry", field.TYPE_INT64, field.TYPE_MESSAGE, ".yc.test.Sample"
+            ),
+        ),
+        ("numbers", field.TYPE_INT64, repeated, None),
+        ("children", field.TYPE_MESSAGE, repeated, ".yc.test.Sample"),
+        ("kind", field.TYPE_ENUM, optional, ".yc.test.Sample.Kind"),
+        ("value", field.TYPE_MESSAGE, optional, ".google.protobuf.Value"),
+        ("wrapped", field.TYPE_MESSAGE, optional, ".google.protobuf.Int64Value"),
+        ("duration", field.TYPE_MESSAGE, optional, ".google.protobuf.Duration"),
+        ("null", field.TYPE_ENUM, optional, ".google.protobuf.NullValue"),
+        ("kinds", field.TYPE_ENUM, repeated, ".yc.test.Sample.Kind"),
+        ("ratios", field.TYPE_DOUBLE, repeated, None),
+        ("snake_name", field.TYPE_STRING, optional, None),
+    ]
+    for number, (name, type_, label, type_name) in enumerate(fields, 1):
+        added = message.field.add(name=name, number=number, type=type_, label=label)
+        if type_name:
+            added.type_name = type_name
+    pool = descriptor_pool.Default()
+    pool.Add(file_proto)
+    return message_factory.GetMessageClass(pool.FindMessageTypeByName("yc.test.Sample"))
+
+
+Sample = sample_class()
+
+
+def sample():
+    child = Sample(i=-1, kind=1, snake_name="child")
+    return Sample(
+        d=0.1,
+        f=0.1,
+        b=b"\x00\xffbytes",
+        i=2 ** 62,
+        u=2 ** 64 - 1,
+        flag=True,
+        by_flag={True: "yes", False: "no"},
+        by_number={-5: child, 7: Sample()},
+        numbers=[1, -(2 ** 63)],
+        children=[child, Sample(kind=5)],
+        kind=5,
+        value=Value(struct_value=Struct(fields=dict(key=Value(number_value=1.5)))),
+        wrapped=Int64Value(value=3),
+        duration=Duration(seconds=90, nanos=500000000),
+        kinds=[0, 1, 7],
+        ratios=[0.5, math.inf],
+        snake_name="sample",
+    )
+
+
+def instance():
+    return Instance(
+        id="fhm1",
+        folder_id="folder",
+        created_at=Timestamp(seconds=1700000000, nanos=123000000),
+        name="vm",
+        labels=dict(role="worker"),
+        zone_id="ru-central1-a",
+        resources=Resources(memory=2 * 2 ** 30, cores=2, core_fraction=100),
+        status=Instance.RUNNING,
+        metadata={"ssh-keys": "user:ssh-ed25519 AAAA"},
+        boot_disk=AttachedDisk(
+            mode=AttachedDisk.READ_WRITE, auto_delete=True, disk_id="disk"
+        ),
+        network_interfaces=[
+            NetworkInterface(
+                index="0",
+                primary_v4_address=PrimaryAddress(
+                    address="10.128.0.5",
+                    one_to_one_nat=OneToOneNat(address="51.250.0.5"),
+                ),
+            )
+        ],
+    )
+
+
+def operation():
+    metadata, response = Any(), Any()
+    metadata.Pack(CreateInstanceMetadata(instance_id="fhm1"))
+    response.Pack(instance())
+    return Operation(
+        id="op",
+        description="Create instance",
+        created_at=Timestamp(seconds=1700000000),
+        done=True,
+        metadata=metadata,
+        response=response,
+    )
+
+
+MESSAGES = dict(
+    empty=Instance(),
+    instance=instance(),
+    disk=Disk(id="disk", size=10 * 2 ** 30, status=Disk.READY, instance_ids=["fhm1"]),
+    operation=operation(),
+    subnet=Subnet(id="subnet", v4_cidr_blocks=["10.128.0.0/24", "10.129.0.0/24"]),
+    update=UpdateInstanceRequest(
+        instance_id="fhm1", update_mask=FieldMask(paths=["name", "labels"])
+    ),
+    sample=sample(),
+    special_floats=Sample(d=-math.inf, f=math.nan, ratios=[math.nan]),
+    timestamp=Timestamp(seconds=1, nanos=10),
+    struct=Struct(fields=dict(key=Value(string_value="value"))),
+)
+
+
+@pytest.mark.parametrize("name", MESSAGES)
+def test_same_as_message_to_dict(name):
+    message = MESSAGES[name]
+    assert message_to_dict(message) == MessageToDict(message)
+
+
+def test_sample_uses_json_names_and_strings_for_int64():
+    result = message_to_dict(sample())
+    assert result["snakeName"] == "sample"
+    assert result["i"] == str(2 ** 62)
+    assert result["byNumber"]["-5"]["kind"] == "SMALL"
+    assert result["byFlag"] == dict(true="yes", false="no")
+    assert result["kinds"] == ["KIND_UNSPECIFIED", "SMALL", 7]
+    assert result["duration"] == "90.500s"
+
+
+def test_special_floats():
+    result = message_to_dict(MESSAGES["special_floats"])
+    assert result == dict(d="-Infinity", f="NaN", ratios=["NaN"])
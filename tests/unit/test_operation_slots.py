@@ -0,0 +1,81 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from time import monotonic
+
+import pytest
+from ansible.module_utils.yc import (  # pylint: disable=E0611, E0401
+    OperationSlots,
+    WaitTimeout,
+)
+
+
+@pytest.fixture
+def slots(tmp_path):
+    return OperationSlots(str(tmp_path), "cloud/folder", 2)
+
+
+def test_slots_are_files_per_name(tmp_path, slots):
+    assert [path.rsplit("/", 1)[1] for path in slots.files] == [
+        "slot-cloud_folder-0.lock",
+        "slot-cloud_folder-1.lock",
+    ]
+    assert OperationSlots(str(tmp_path), "other", 2).files != slots.files
+
+
+def test_acquire_takes_free_slots(slots):
+    first = slots.acquire()
+    second = slots.acquire()
+    assert first.name != second.name
+    first.close()
+    second.close()
+
+
+def test_acquire_without_timeout_does_not_wait(slots):
+    held = [slots.acquire(), slots.acquire()]
+    waits = list()
+    started = monotonic()
+    with pytest.raises(WaitTimeout, match="No free operation slot$"):
+        slots.acquire(on_wait=lambda: waits.append(1))
+    assert monotonic() - started < 0.5
+    assert not waits
+    for slot in held:
+        slot.close()
+
+
+def test_acquire_waits_up_to_timeout(slots):
+    held = [slots.acquire(), slots.acquire()]
+    waits = list()
+    started = monotonic()
+    with pytest.raises(WaitTimeout, match="in 0.3 seconds"):
+        slots.acquire(timeout=0.3, on_wait=lambda: waits.append(1))
+    assert monotonic() - started >= 0.3
+    assert waits
+    for slot in held:
+        slot.close()
+
+
+def test_closed_file_frees_its_slot(slots):
+    held = [slots.acquire(), slots.acquire()]
+    held[0].close()
+    slot = slots.acquire()
+    assert slot.name == held[0].name
+    slot.close()
+    held[1].close()
+
+
+def test_on_wait_can_free_a_slot(slots):
+    held = [slots.acquire(), slots.acquire()]
+    slot = slots.acquire(timeout=5, on_wait=held[1].close)
+    assert slot.name == held[1].name
+    slot.close()
+    held[0].close()
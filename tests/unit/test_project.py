@@ -0,0 +1,172 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import copy
+
+from ansible.module_utils.yc import (  # pylint: disable=E0611, E0401
+    COMPACT_FIELDS,
+    YC,
+    project,
+    project_resource,
+)
+
+INSTANCE = dict(
+    id="fhm1",
+    name="vm",
+    labels=dict(role="worker"),
+    resources=dict(cores="2", memory="2147483648"),
+    networkInterfaces=[
+        dict(
+            index="0",
+            primaryV4Address=dict(
+                address="10.128.0.5", oneToOneNat=dict(address="51.250.0.5")
+            ),
+        ),
+        dict(index="1", primaryV4Address=dict(address="10.129.0.5")),
+        dict(index="2"),
+    ],
+    secondaryDiskIds=["disk-1", "disk-2"],
+)
+
+
+def test_top_level_fields():
+    assert project(INSTANCE, ["id", "labels"]) == dict(
+        id="fhm1", labels=dict(role="worker")
+    )
+
+
+def test_nested_fields_are_merged():
+    assert project(INSTANCE, ["resources.cores", "resources.memory", "name"]) == dict(
+        resources=dict(cores="2", memory="2147483648"), name="vm"
+    )
+
+
+def test_missing_fields_are_skipped():
+    assert project(INSTANCE, ["fqdn", "bootDisk.diskId", "name"]) == dict(name="vm")
+
+
+def test_paths_go_through_lists_item_by_item():
+    assert project(
+        INSTANCE,
+        [
+            "networkInterfaces.primaryV4Address.address",
+            "networkInterfaces.primaryV4Address.oneToOneNat.address",
+        ],
+    ) == dict(
+        networkInterfaces=[
+            dict(
+                primaryV4Address=dict(
+                    address="10.128.0.5", oneToOneNat=dict(address="51.250.0.5")
+                )
+            ),
+            dict(primaryV4Address=dict(address="10.129.0.5")),
+            dict(),
+        ]
+    )
+
+
+def test_lists_of_scalars_are_kept_whole():
+    assert project(INSTANCE, ["secondaryDiskIds", "secondaryDiskIds.id"]) == dict(
+        secondaryDiskIds=["disk-1", "disk-2"]
+    )
+
+
+def test_source_is_not_changed():
+    project(INSTANCE, ["networkInterfaces.index"])
+    assert len(INSTANCE["networkInterfaces"][0]) == 2
+
+
+INSTANCE_TYPE = "type.googleapis.com/yandex.cloud.compute.v1.Instance"
+METADATA_TYPE = "type.googleapis.com/yandex.cloud.compute.v1.UpdateInstanceMetadata"
+OPERATION = dict(
+    id="op",
+    description="Update instance",
+    done=True,
+    metadata={"@type": METADATA_TYPE, "instanceId": "fhm1"},
+    response=dict(INSTANCE, **{"@type": INSTANCE_TYPE}),
+)
+
+
+def test_operation_payloads_are_projected():
+    assert project_resource(OPERATION, ["networkInterfaces.index", "done"]) == dict(
+        done=True,
+        metadata={"@type": METADATA_TYPE},
+        response={
+            "@type": INSTANCE_TYPE,
+            "networkInterfaces": [dict(index="0"), dict(index="1"), dict(index="2")],
+        },
+    )
+
+
+def test_operation_paths_keep_their_fields():
+    assert project_resource(OPERATION, ["id", "response.name", "instanceId"]) == dict(
+        id="op",
+        metadata={"@type": METADATA_TYPE, "instanceId": "fhm1"},
+        response={"@type": INSTANCE_TYPE, "id": "fhm1", "name": "vm"},
+    )
+
+
+def test_operation_is_not_changed():
+    before = copy.deepcopy(OPERATION)
+    assert (
+        project_resource(OPERATION, ["response", "id"])["response"]
+        == before["response"]
+    )
+    assert OPERATION == before
+
+
+def test_resources_without_payloads_are_projected_as_is():
+    assert project_resource(INSTANCE, ["id"]) == project(INSTANCE, ["id"])
+
+
+class Module(YC):
+    RESOURCE_KEYS = ("instance",)
+    RESOURCE_MAPS = ("instances",)
+    RESULT_MAPS = ("results",)
+
+
+def projected(result, **params):
+    module = Module.__new__(Module)
+    module.params = params
+    module._project_result(
+        result, module._return_fields()
+    )  # pylint: disable=protected-access
+    return result
+
+
+def test_result_without_fields_is_whole():
+    assert projected(dict(instance=INSTANCE)) == dict(instance=INSTANCE)
+
+
+def test_result_resources_are_projected():
+    result = projected(
+        dict(
+            changed=True,
+            instance=INSTANCE,
+            instances=dict(fhm1=INSTANCE),
+            results=dict(vm=dict(instance=INSTANCE, msg="done")),
+        ),
+        return_fields=["id"],
+    )
+    assert result == dict(
+        changed=True,
+        instance=dict(id="fhm1"),
+        instances=dict(fhm1=dict(id="fhm1")),
+        results=dict(vm=dict(instance=dict(id="fhm1"), msg="done")),
+    )
+
+
+def test_compact_adds_its_fields():
+    result = projected(dict(instance=INSTANCE), compact=True, return_fields=["labels"])
+    assert set(result["instance"]) == {"labels"} | {
+        field.split(".")[0] for field in COMPACT_FIELDS
+    } & set(INSTANCE)
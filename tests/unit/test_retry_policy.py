@@ -0,0 +1,142 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import grpc
+import pytest
+from ansible.module_utils import yc  # pylint: disable=E0611, E0401
+from ansible.module_utils.yc import (  # pylint: disable=E0611, E0401
+    YC,
+    RetryPolicy,
+    Timings,
+)
+
+
+class RpcError(grpc.RpcError):
+    def __init__(self, code):
+        super().__init__(code)
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(yc, "sleep", lambda delay: None)
+
+
+def failing(*codes, result="ok"):
+    """fn that raises RpcErrors of codes one by one, then returns result."""
+    errors = [RpcError(code) for code in codes]
+    calls = list()
+
+    def fn(*args):
+        calls.append(args)
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    fn.calls = calls
+    return fn
+
+
+def test_delay_is_full_jitter_up_to_max_delay():
+    policy = RetryPolicy(multiplier=2, base_delay=0.5, max_delay=3)
+    for attempt, cap in enumerate((0.5, 1, 2, 3, 3)):
+        delays = [policy.delay(attempt) for _ in range(200)]
+        assert 0 <= min(delays) and max(delays) <= cap
+        assert max(delays) > cap / 2
+
+
+def test_run_retries_retryable_codes():
+    fn = failing(grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.RESOURCE_EXHAUSTED)
+    policy = RetryPolicy()
+    assert policy.run(fn, "request") == "ok"
+    assert fn.calls == [("request",)] * 3
+    report = policy.report()
+    assert report["total"] == 2
+    assert report["by_code"] == dict(UNAVAILABLE=1, RESOURCE_EXHAUSTED=1)
+    assert report["budget_left"] == 48
+    assert report["budget_exhausted"] == 0
+
+
+def test_run_does_not_retry_other_codes():
+    fn = failing(grpc.StatusCode.NOT_FOUND)
+    policy = RetryPolicy()
+    with pytest.raises(grpc.RpcError):
+        policy.run(fn)
+    assert len(fn.calls) == 1
+    assert policy.retries == 0
+
+
+def test_run_stops_after_max_retries():
+    fn = failing(*[grpc.StatusCode.UNAVAILABLE] * 3)
+    policy = RetryPolicy(max_retries=2)
+    with pytest.raises(grpc.RpcError):
+        policy.run(fn)
+    assert len(fn.calls) == 3
+    assert policy.retries == 2
+
+
+def test_budget_is_shared_by_calls():
+    policy = RetryPolicy(budget=3)
+    assert policy.run(failing(*[grpc.StatusCode.UNAVAILABLE] * 2)) == "ok"
+    fn = failing(*[grpc.StatusCode.UNAVAILABLE] * 2)
+    with pytest.raises(grpc.RpcError):
+        policy.run(fn)
+    assert len(fn.calls) == 2
+    report = policy.report()
+    assert report["total"] == 3
+    assert report["budget_left"] == 0
+    assert report["budget_exhausted"] == 1
+
+
+def test_count_is_not_limited_by_budget():
+    policy = RetryPolicy(budget=0)
+    assert not policy.take("UNAVAILABLE")
+    policy.count("QUOTA")
+    assert policy.report() == dict(
+        total=1, by_code=dict(QUOTA=1), slept=0.0, budget_left=0, budget_exhausted=1
+    )
+
+
+def test_sleep_adds_up_delays():
+    policy = RetryPolicy(base_delay=1, max_delay=1)
+    slept = policy.sleep(0) + policy.sleep(0)
+    assert policy.report()["slept"] == round(slept, 3)
+
+
+def stats(policy, **params):
+    module = YC.__new__(YC)
+    module.params = dict(params)
+    module.waits = 0
+    module.retry_policy = policy
+    module.timings = Timings()
+    result = dict()
+    module._add_stats(result)  # pylint: disable=protected-access
+    return result
+
+
+def test_stats_leave_out_retries_when_none_happened():
+    assert "retries" not in stats(RetryPolicy())
+
+
+def test_stats_report_budget_exhausted_without_retries():
+    policy = RetryPolicy(budget=0)
+    policy.take("UNAVAILABLE")
+    assert stats(policy)["retries"]["budget_exhausted"] == 1
+
+
+def test_stats_report_retries_when_profiling():
+    result = stats(RetryPolicy(), profile=True)
+    assert result["retries"]["total"] == 0
+    assert "timings" in result
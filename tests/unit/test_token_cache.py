@@ -0,0 +1,78 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from time import time
+
+import pytest
+from ansible.module_utils import yc  # pylint: disable=E0611, E0401
+from ansible.module_utils.yc import sdk_auth  # pylint: disable=E0611, E0401
+
+KEY = dict(id="key/1", service_account_id="account", private_key="private key")
+
+
+@pytest.fixture
+def exchanges(monkeypatch):
+    """Counts IAM token exchanges, each token lives for lifetime seconds."""
+    state = dict(count=0, lifetime=12 * 60 * 60)
+
+    def create_iam_token(auth):
+        state["count"] += 1
+        return "iam-token-%s" % state["count"], time() + state["lifetime"]
+
+    monkeypatch.setattr(yc, "create_iam_token", create_iam_token)
+    return state
+
+
+@pytest.fixture
+def auth(tmp_path):
+    return dict(
+        service_account_key=KEY,
+        token_cache=True,
+        token_cache_dir=str(tmp_path),
+        token_cache_margin=300,
+    )
+
+
+def test_without_token_cache_key_is_used(auth, exchanges):
+    kwargs = sdk_auth(dict(auth, token_cache=False), 600)
+    assert kwargs["service_account_key"] == KEY
+    assert "iam_token" not in kwargs
+    assert exchanges["count"] == 0
+
+
+def test_cached_token_is_reused(auth, exchanges):
+    first = sdk_auth(auth, 600)
+    second = sdk_auth(auth, 600)
+    assert first["iam_token"] == second["iam_token"] == "iam-token-1"
+    assert first["service_account_key"] is None
+    assert exchanges["count"] == 1
+
+
+def test_token_expiring_during_the_wait_is_exchanged(auth, exchanges):
+    exchanges["lifetime"] = 800
+    assert sdk_auth(auth, 0)["iam_token"] == "iam-token-1"
+    exchanges["lifetime"] = 12 * 60 * 60
+    assert sdk_auth(auth, 600)["iam_token"] == "iam-token-2"
+    assert sdk_auth(auth, 0)["iam_token"] == "iam-token-2"
+
+
+def test_wait_without_limit_keeps_key(auth, exchanges):
+    kwargs = sdk_auth(auth, None)
+    assert kwargs["service_account_key"] == KEY
+    assert "iam_token" not in kwargs
+    assert exchanges["count"] == 0
+
+
+def test_wait_longer_than_a_token_lives_keeps_key(auth, exchanges):
+    kwargs = sdk_auth(auth, 24 * 60 * 60)
+    assert kwargs["service_account_key"] == KEY
+    assert "iam_token" not in kwargs
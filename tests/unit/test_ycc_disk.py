@@ -0,0 +1,105 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from yandex.cloud.compute.v1.disk_pb2 import Disk
+from yandex.cloud.compute.v1.disk_service_pb2 import ListDisksResponse
+from ycc_disk import YccDisk
+
+DISKS = [
+    Disk(
+        id="disk-a",
+        zone_id="ru-central1-a",
+        type_id="network-hdd",
+        labels=dict(env="prod"),
+    ),
+    Disk(
+        id="disk-b",
+        zone_id="ru-central1-a",
+        type_id="network-ssd",
+        labels=dict(env="prod", index="1"),
+        instance_ids=["instance-b"],
+    ),
+    Disk(
+        id="disk-c",
+        zone_id="ru-central1-b",
+        type_id="network-hdd",
+        instance_ids=["instance-c"],
+    ),
+]
+
+
+class DiskService:
+    """List of the disks page by page."""
+
+    def __init__(self, disks):
+        self.disks = disks
+        self.requests = list()
+
+    def List(self, request):  # pylint: disable=invalid-name
+        self.requests.append((request.page_token, request.page_size, request.filter))
+        start = int(request.page_token or 0)
+        end = start + request.page_size
+        return ListDisksResponse(
+            disks=self.disks[start:end],
+            next_page_token=str(end) if end < len(self.disks) else "",
+        )
+
+
+def disk_module(**params):
+    module = YccDisk.__new__(YccDisk)
+    module.params = dict(folder_id="folder", name=None, max_results=0, page_size=1000)
+    module.params.update(params)
+    module.disk_service = DiskService(DISKS)
+    return module
+
+
+def matching(**params):
+    matches = disk_module(**params)._matches  # pylint: disable=protected-access
+    return [disk.id for disk in DISKS if matches(disk)]
+
+
+@pytest.mark.parametrize(
+    "params, ids",
+    [
+        (dict(), ["disk-a", "disk-b", "disk-c"]),
+        (dict(zone_id="ru-central1-a"), ["disk-a", "disk-b"]),
+        (dict(type_id="network-hdd"), ["disk-a", "disk-c"]),
+        (dict(attached=True), ["disk-b", "disk-c"]),
+        (dict(attached=False), ["disk-a"]),
+        (dict(labels=dict(env="prod")), ["disk-a", "disk-b"]),
+        (dict(labels=dict(env="prod", index=1)), ["disk-b"]),
+        (dict(zone_id="ru-central1-b", attached=False), []),
+    ],
+)
+def test_matches(params, ids):
+    assert matching(**params) == ids
+
+
+def test_list_disks_pages_through_the_folder():
+    module = disk_module(page_size=2, name="data")
+    response = module.list_disks()
+    assert list(response["disks"]) == ["disk-a", "disk-b", "disk-c"]
+    assert response["disks"]["disk-b"]["instanceIds"] == ["instance-b"]
+    assert not response["truncated"]
+    assert module.disk_service.requests == [
+        ("", 2, 'name="data"'),
+        ("2", 2, 'name="data"'),
+    ]
+
+
+def test_list_disks_stops_at_max_results():
+    module = disk_module(page_size=1, max_results=1, attached=True)
+    response = module.list_disks()
+    assert list(response["disks"]) == ["disk-b"]
+    assert response["truncated"]
+    assert len(module.disk_service.requests) == 3
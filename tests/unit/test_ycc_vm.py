@@ -0,0 +1,103 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+
+import grpc
+import pytest
+from ansible.module_utils.yc import OperationError  # pylint: disable=E0611, E0401
+from yandex.cloud.operation.operation_pb2 import Operation
+from ycc_vm import YccVM
+
+INSTANCE = dict(
+    id="fhm1",
+    status="RUNNING",
+    resources=dict(cores="2", memory=str(2 * 2 ** 30), coreFraction="100"),
+    labels=dict(role="worker"),
+    metadata=dict(),
+)
+
+
+class InstanceService:
+    """Records the calls, Update raises error when it is set."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = list()
+
+    def _call(self, method):
+        def call(request):
+            self.calls.append(method)
+            if method == "Update" and self.error:
+                raise self.error
+            return Operation(id="%s-op" % method, description=method)
+
+        return call
+
+    def __getattr__(self, method):
+        return self._call(method)
+
+
+def reconcile(service, spec, differences, wait_error=None):
+    module = YccVM.__new__(YccVM)
+    module.aio = SimpleNamespace(client=lambda stub: service)
+    module.active_op_limit_timeout = lambda timeout, fn, *args: fn(*args)
+    module.waiter = lambda operation: Operation(id=operation.id, done=True)
+
+    def wait_all(operations):
+        if wait_error:
+            raise wait_error
+        return operations
+
+    module.wait_all = wait_all
+    return module._submit_reconcile(  # pylint: disable=protected-access
+        INSTANCE, dict(spec), differences
+    )
+
+
+def test_in_place_update_does_not_restart():
+    service = InstanceService()
+    response, operation = reconcile(service, dict(labels=dict(role="db")), [])
+    assert service.calls == ["Update"]
+    assert operation.id == "Update-op"
+    assert response["reconcile"] == dict(in_place=["labels"], restart=[], recreate=[])
+
+
+def test_restart_update_stops_and_starts():
+    service = InstanceService()
+    response, operation = reconcile(service, dict(cores=4), ["cores"])
+    assert service.calls == ["Stop", "Update", "Start"]
+    assert operation.id == "Start-op"
+    assert response["reconcile"]["restart"] == ["cores"]
+
+
+def test_failed_update_call_still_starts():
+    service = InstanceService(error=grpc.RpcError("update failed"))
+    with pytest.raises(grpc.RpcError):
+        reconcile(service, dict(cores=4), ["cores"])
+    assert service.calls == ["Stop", "Update", "Start"]
+
+
+def test_failed_update_operation_still_starts():
+    service = InstanceService()
+    error = OperationError(Operation(id="Update-op", description="Update"))
+    with pytest.raises(OperationError):
+        reconcile(service, dict(cores=4), ["cores"], wait_error=error)
+    assert service.calls == ["Stop", "Update", "Start"]
+
+
+def test_recreate_fields_fail_without_calls():
+    service = InstanceService()
+    response, operation = reconcile(service, dict(cores=4), ["cores", "zone_id"])
+    assert operation is None
+    assert response["failed"]
+    assert service.calls == []